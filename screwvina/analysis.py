@@ -5,24 +5,72 @@ Contains the function to analyze docking results.
 
 """
 
+import os
 from statistics import mean, stdev
 
 from config import results_folder, project_folder  
 from log_reading import read_vina_log
+from dedup import load_alias_pairs
 
 
 
-def analyze_results(output_filename="vina_results.tsv"):
-
-    print("=" * 70)
-    print("STARTING ANALYSIS...")
-    print("=" * 70)
-
+def summarize_log(log_file):
+    """
+    Compute the affinity and RMSD statistics of a single Vina log.
+    
+    Args:
+        log_file: Path to the Vina log file
+        
+    Returns:
+        Dictionary of statistics, or None if the log has no data
+    """
+    affinity, rmsd = read_vina_log(log_file)        # reads the log file
+
+    if not affinity:
+        return None         # skip where there is no data
+
+    best_aff = affinity[0]      # best affinity is always the first mode
+
+    if len(affinity) == 1:          # calculates statistics for affinity values
+        mean_aff = affinity[0]
+        dev_aff = 0.0
+    else:
+        mean_aff = mean(affinity)
+        dev_aff = stdev(affinity)
+
+    rmsd_from_pose2 = rmsd[1:] if len(rmsd) > 1 else []     # statistics for RMSD (first pose skipped, always 0)
+    if not rmsd_from_pose2:
+        mean_rmsd = 0.0
+        dev_rmsd = 0.0
+    elif len(rmsd_from_pose2) == 1:
+        mean_rmsd = rmsd_from_pose2[0]
+        dev_rmsd = 0.0
+    else:
+        mean_rmsd = mean(rmsd_from_pose2)
+        dev_rmsd = stdev(rmsd_from_pose2)
+
+    return {
+        "best_affinity": best_aff,
+        "mean_affinity": mean_aff,
+        "stdev_affinity": dev_aff,
+        "mean_rmsd": mean_rmsd,
+        "stdev_rmsd": dev_rmsd
+    }
+
+
+def collect_results():
+    """
+    Collect the statistics of all docking logs in the results folder.
+    
+    Returns:
+        List of result dictionaries (receptor, ligand and statistics),
+        or None if there is no vs_* directory to analyze
+    """
 
     # Step 1: check the output folder exists ---------------------------------------------------------------------------------------------------
     if not results_folder.exists():
         print(f"ERROR: Output folder {results_folder} does not exist")      # though it should be created by the script at the beginning
-        return
+        return None
     
 
     # Step 2: Find all vs_* directories --------------------------------------------------------------------------------------------------------
@@ -33,7 +81,7 @@ def analyze_results(output_filename="vina_results.tsv"):
 
     if not vs_directories:
         print (f"ERROR: No vs_* directory found in {results_folder}")
-        return
+        return None
     
     print(f"{len(vs_directories)} directories found")
 
@@ -43,70 +91,138 @@ def analyze_results(output_filename="vina_results.tsv"):
     results = []        # initializing list of results
 
     for directory in vs_directories:
-        rec_name = directory.name.replace("vs_", "")    # receptor name (e.g. vs_proteinA -> proteinA)
+        rec_name = directory.name.replace("vs_", "", 1)    # receptor name (e.g. vs_proteinA -> proteinA)
         
         log_folder = directory / "logs"     # directory with log files
         if not log_folder.exists():
             continue
 
         for log_file in log_folder.glob("*.log"):
-            lig_name = log_file.stem.split("_")[-1]     # ligand name from filename (e.g. proteinA_ligand1.log -> ligand1)
-
-            affinity, rmsd = read_vina_log(log_file)        # reads the log file
+            # ligand name from filename (e.g. proteinA_ligand1.log -> ligand1), underscores in names are kept
+            if log_file.stem.startswith(f"{rec_name}_"):
+                lig_name = log_file.stem[len(rec_name) + 1:]
+            else:
+                lig_name = log_file.stem.split("_")[-1]
 
-            if not affinity:
+            stats = summarize_log(log_file)
+            if stats is None:
                 continue        # skip where there is no data
-
-            best_aff = affinity[0]      # best affinity is always the first mode
-
-            if len(affinity) == 1:          # calculates statistics for affinity values
-                mean_aff = affinity[0]
-                dev_aff = 0.0
-            else:
-                mean_aff = mean(affinity)
-                dev_aff = stdev(affinity)
-
-            rmsd_from_pose2 = rmsd[1:] if len(rmsd) > 1 else []     # statistics for RMSD (first pose skipped, always 0)
-            if not rmsd_from_pose2:
-                mean_rmsd = 0.0
-                dev_rmsd = 0.0
-            elif len(rmsd_from_pose2) == 1:
-                mean_rmsd = rmsd_from_pose2[0]
-                dev_rmsd = 0.0
-            else:
-                mean_rmsd = mean(rmsd_from_pose2)
-                dev_rmsd = stdev(rmsd_from_pose2)
             
             results.append({            # appending results to the results list
                 "receptor": rec_name,
                 "ligand": lig_name,
-                "best_affinity": best_aff,
-                "mean_affinity": mean_aff,
-                "stdev_affinity": dev_aff,
-                "mean_rmsd": mean_rmsd,
-                "stdev_rmsd": dev_rmsd
+                **stats
             })
-    
 
-    # Step 4: Write TSV file -----------------------------------------------------------------------------------------------------------------
 
-    out_file = project_folder / output_filename
+    # Step 3.1: Copy the results of deduplicated ligands to the alias pairs planned by the last docking run ----------------------------------
+
+    alias_pairs = load_alias_pairs()
+    if alias_pairs:
+        docked = {(r["receptor"], r["ligand"]): r for r in results}
+
+        for rec_name, alias, docked_as in alias_pairs:
+            r = docked.get((rec_name, docked_as))
+            if r is not None and (rec_name, alias) not in docked:      # aliases docked on their own keep their results
+                results.append({**r, "ligand": alias})
+
+    return results
+
+
+RESULTS_HEADER = "Receptor\tLigand\tBest_Affinity\tAvg_Affinity\tStd_Dev_Affinity\tAvg_RMSD_UB\tStd_Dev_RMSD_UB\n"
 
-    with open(out_file, "w") as f:          # write header
-        f.write(
-            "Receptor\tLigand\tBest_Affinity\tAvg_Affinity\tStd_Dev_Affinity\tAvg_RMSD_UB\tStd_Dev_RMSD_UB\n"
-        )
 
+def format_result(r):
+    """Format a result dictionary as a row of the results TSV file."""
+    return (
+        f"{r['receptor']}\t"
+        f"{r['ligand']}\t"
+        f"{r['best_affinity']:.3f}\t"   # display 3 significative digits
+        f"{r['mean_affinity']:.3f}\t"
+        f"{r['stdev_affinity']:.3f}\t"
+        f"{r['mean_rmsd']:.3f}\t"
+        f"{r['stdev_rmsd']:.3f}\n"
+    )
+
+
+def write_results(results, out_file):
+    """
+    Write the results TSV file (through a temporary file, so readers never see it half-written).
+    
+    Args:
+        results: Iterable of result dictionaries
+        out_file: Path to the TSV file
+    """
+    tmp_file = out_file.with_name(f".{out_file.name}.tmp")
+
+    with open(tmp_file, "w") as f:
+        f.write(RESULTS_HEADER)         # write header
         for r in results:               # write results
-            f.write(
-                f"{r['receptor']}\t"
-                f"{r['ligand']}\t"
-                f"{r['best_affinity']:.3f}\t"   # display 3 significative digits
-                f"{r['mean_affinity']:.3f}\t"
-                f"{r['stdev_affinity']:.3f}\t"
-                f"{r['mean_rmsd']:.3f}\t"
-                f"{r['stdev_rmsd']:.3f}\n"
-            )
+            f.write(format_result(r))
+
+    os.replace(tmp_file, out_file)
+
+
+def append_results(results, out_file):
+    """
+    Append rows to the results TSV file (the header is written if the file is new).
+    
+    Args:
+        results: Iterable of result dictionaries
+        out_file: Path to the TSV file
+    """
+    with open(out_file, "a") as f:
+        if f.tell() == 0:
+            f.write(RESULTS_HEADER)
+        for r in results:
+            f.write(format_result(r))
+
+
+def read_results(out_file):
+    """
+    Read back a results TSV file written by write_results().
+    
+    Args:
+        out_file: Path to the TSV file
+        
+    Returns:
+        List of result dictionaries, or None if the file is missing or not a results file
+    """
+    keys = ["best_affinity", "mean_affinity", "stdev_affinity", "mean_rmsd", "stdev_rmsd"]
+    results = []
+    try:
+        with open(out_file, "r") as f:
+            if f.readline() != RESULTS_HEADER:
+                return None
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 7:
+                    continue
+                results.append({"receptor": parts[0], "ligand": parts[1],
+                                **dict(zip(keys, map(float, parts[2:])))})
+    except (FileNotFoundError, ValueError):
+        return None
+    return results
+
+
+def analyze_results(output_filename="vina_results.tsv"):
+
+    print("=" * 70)
+    print("STARTING ANALYSIS...")
+    print("=" * 70)
+
+
+    # Steps 1-3: Find the vs_* directories and collect all results ------------------------------------------------------------------------------
+
+    results = collect_results()
+    if results is None:
+        return
+    
+
+    # Step 4: Write TSV file -----------------------------------------------------------------------------------------------------------------
+
+    out_file = project_folder / output_filename
+    write_results(results, out_file)
 
     
     # Step 5: Show final result -----------------------------------------------------------------------------------------------------------------
@@ -16,3 +16,5 @@ receptors_folder = project_folder / "receptors"
 ligands_folder = project_folder / "ligands"
 configurations_folder = project_folder / "configurations"
 results_folder = project_folder / "vs_runs"
+maps_cache_folder = project_folder / "maps_cache"
+prep_cache_folder = project_folder / "prep_cache"
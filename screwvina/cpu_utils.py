@@ -37,7 +37,7 @@ def read_cpu_from_config(config_path):
                 if line.startswith('cpu'):
                     parts = line.split('=')
                     if len(parts) >= 2:
-                        return int(parts[1].strip())
+                        return int(parts[1].split('#')[0].strip())    # ignore inline comments
     except:
         pass
     return 1
@@ -88,3 +88,142 @@ def calculate_optimal_jobs(config_cpu, system_cores):
     
     optimal = system_cores // config_cpu
     return max(1, optimal)  # At least 1 job
+
+
+# Adaptive concurrency thresholds (load is per core, PSI values are "some avg10" percentages)
+ADAPTIVE_INTERVAL = 10          # seconds between two decisions
+ADAPTIVE_COOLDOWN = 60          # seconds between two decreases (one 1-minute load average window)
+LOAD_HIGH = 1.25
+LOAD_LOW = 0.9
+CPU_PSI_HIGH = 25.0
+CPU_PSI_LOW = 10.0
+MEM_PSI_HIGH = 10.0
+MEM_PSI_LOW = 1.0
+MEM_AVAILABLE_LOW = 0.10        # fraction of total memory
+MEM_AVAILABLE_HIGH = 0.20
+
+
+def read_pressure(resource):
+    """
+    Read the pressure stall information (PSI) of a resource.
+    
+    Args:
+        resource: "cpu", "memory" or "io"
+        
+    Returns:
+        "some avg10" percentage, or None if PSI is not available
+    """
+    try:
+        with open(f"/proc/pressure/{resource}", 'r') as f:
+            for line in f:
+                if line.startswith('some'):
+                    for field in line.split()[1:]:
+                        key, value = field.split('=')
+                        if key == 'avg10':
+                            return float(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def read_memory_available():
+    """
+    Read the fraction of system memory available for new processes.
+    
+    Returns:
+        MemAvailable / MemTotal, or None if /proc/meminfo is not available
+    """
+    values = {}
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                values[key] = int(value.split()[0])
+        return values["MemAvailable"] / values["MemTotal"]
+    except (OSError, ValueError, KeyError, ZeroDivisionError):
+        return None
+
+
+def read_system_load(system_cores):
+    """
+    Take a snapshot of the system load.
+    
+    Args:
+        system_cores: Total system cores available
+        
+    Returns:
+        Dictionary with load (1-minute load average per core), cpu_psi,
+        mem_psi and mem_available (None when not available)
+    """
+    try:
+        load = os.getloadavg()[0] / system_cores
+    except OSError:
+        load = None
+
+    return {
+        "load": load,
+        "cpu_psi": read_pressure("cpu"),
+        "mem_psi": read_pressure("memory"),
+        "mem_available": read_memory_available()
+    }
+
+
+def adaptive_jobs(current_jobs, min_jobs, max_jobs, load):
+    """
+    Decide the number of parallel jobs from a load snapshot (AIMD).
+    The number of jobs is halved as soon as any indicator shows pressure,
+    and increased by one only when all indicators are comfortably low.
+    CPU pressure (10-second average) is preferred to the load average,
+    which lags behind by a minute and is only used when PSI is not available.
+    
+    Args:
+        current_jobs: Current number of parallel jobs
+        min_jobs: Lower bound
+        max_jobs: Upper bound
+        load: Snapshot from read_system_load()
+        
+    Returns:
+        (new_jobs, reason)
+    """
+    def above(value, threshold):
+        return value is not None and value > threshold
+
+    def below(value, threshold):
+        return value is None or value < threshold
+
+    has_psi = load["cpu_psi"] is not None
+
+    if above(load["mem_psi"], MEM_PSI_HIGH):
+        reason = f"memory pressure {load['mem_psi']:.1f}%"
+    elif load["mem_available"] is not None and load["mem_available"] < MEM_AVAILABLE_LOW:
+        reason = f"available memory {load['mem_available']:.0%}"
+    elif has_psi and above(load["cpu_psi"], CPU_PSI_HIGH):
+        reason = f"CPU pressure {load['cpu_psi']:.1f}%"
+    elif not has_psi and above(load["load"], LOAD_HIGH):
+        reason = f"load {load['load']:.2f} per core"
+    else:
+        reason = None
+
+    if reason is not None:                                  # multiplicative decrease
+        return max(min_jobs, current_jobs // 2), reason
+
+    cpu_idle = below(load["cpu_psi"], CPU_PSI_LOW) if has_psi else below(load["load"], LOAD_LOW)
+
+    if (cpu_idle and below(load["mem_psi"], MEM_PSI_LOW)
+            and (load["mem_available"] is None or load["mem_available"] > MEM_AVAILABLE_HIGH)):
+        return min(max_jobs, current_jobs + 1), "system idle"     # additive increase
+
+    return current_jobs, "steady"
+
+
+def format_system_load(load):
+    """Format a load snapshot for log messages."""
+    def fmt(value, pattern):
+        return "n/a" if value is None else pattern.format(value)
+
+    return (
+        f"load/core={fmt(load['load'], '{:.2f}')} "
+        f"cpu_psi={fmt(load['cpu_psi'], '{:.1f}%')} "
+        f"mem_psi={fmt(load['mem_psi'], '{:.1f}%')} "
+        f"mem_avail={fmt(load['mem_available'], '{:.0%}')}"
+    )
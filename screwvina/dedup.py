@@ -0,0 +1,348 @@
+"""
+dedup.py - Ligand Deduplication Module
+
+Contains the functions to find ligand PDBQT files that describe the same
+molecule (same topology, atom types, rotatable bonds and stereochemistry,
+whatever the atom order or coordinates) so that only one of them is docked.
+"""
+
+import hashlib
+import os
+from math import dist
+
+from config import results_folder
+
+
+aliases_file = results_folder / "ligand_aliases.tsv"
+alias_pairs_file = results_folder / "ligand_alias_pairs.tsv"
+fingerprints_file = results_folder / ".ligand_fingerprints.tsv"
+
+# Covalent radii (Angstroms) of the elements behind the AutoDock atom types
+COVALENT_RADII = {
+    "H": 0.31, "C": 0.76, "N": 0.71, "O": 0.66, "F": 0.57, "P": 1.07, "S": 1.05,
+    "Cl": 1.02, "Br": 1.20, "I": 1.39, "Si": 1.11, "B": 0.84, "Se": 1.20
+}
+
+AD_ELEMENTS = {
+    "HD": "H", "HS": "H", "A": "C", "NA": "N", "NS": "N", "OA": "O", "OS": "O",
+    "SA": "S", "CL": "Cl", "BR": "Br", "G0": "C", "G1": "C", "G2": "C", "G3": "C",
+    "CG0": "C", "CG1": "C", "CG2": "C", "CG3": "C", "W": "O"
+}
+
+BOND_TOLERANCE = 0.45       # bonded if distance < r1 + r2 + tolerance
+
+FINGERPRINT_VERSION = "2"   # bump to invalidate the cached fingerprints when the fingerprint changes
+
+STEREO_ELEMENTS = {"C": 3, "S": 3, "P": 3, "N": 4}     # element -> minimum number of neighbours of a stereocentre
+PLANAR_VOLUME = 0.3         # |det| of the unit bond vectors below which a centre is planar (tetrahedral: ~0.77)
+DOUBLE_BOND_TYPES = {"C", "N", "NA"}
+DOUBLE_BOND_LENGTH = 1.38   # non-rotatable C=C / C=N bonds are shorter than this (C-C 1.54, C-N 1.47)
+
+
+def read_ligand_graph(ligand_path):
+    """
+    Read the atoms, bonds and rotatable bonds of a ligand PDBQT file.
+    Coordinates are only used to find the bonds.
+
+    Args:
+        ligand_path: Path to the ligand PDBQT file
+
+    Returns:
+        (types, bonds, coords): list of AutoDock atom types, dictionary
+        {(i, j): rotatable} of the bonds between atom indices, and atom coordinates
+    """
+    types = []
+    coords = []
+    serials = {}
+    rotatable = set()
+
+    with open(ligand_path, "r") as f:
+        for line in f:
+            if line.startswith(("ATOM", "HETATM")):
+                serials[int(line[6:11])] = len(types)
+                types.append(line[77:79].strip())
+                coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+            elif line.startswith("BRANCH"):
+                parts = line.split()
+                rotatable.add((int(parts[1]), int(parts[2])))
+
+    rotatable = {frozenset((serials[a], serials[b])) for a, b in rotatable if a in serials and b in serials}
+
+    radii = [COVALENT_RADII.get(AD_ELEMENTS.get(t, t), 0.77) for t in types]
+    bonds = {}
+    for i in range(len(types)):
+        for j in range(i + 1, len(types)):
+            if dist(coords[i], coords[j]) < radii[i] + radii[j] + BOND_TOLERANCE:
+                bonds[(i, j)] = frozenset((i, j)) in rotatable
+    for pair in rotatable:              # torsion tree bonds always count, even if stretched
+        i, j = sorted(pair)
+        bonds[(i, j)] = True
+
+    return types, bonds, coords
+
+
+def stereo_tags(types, bonds, coords, neighbours, labels):
+    """
+    Find the stereo configuration of the tetrahedral centres and double bonds of a ligand,
+    independent of atom order and coordinates: neighbours are ordered by their (stable)
+    refined labels, and only the sign of the resulting geometry is kept.
+
+    Args:
+        types, bonds, coords: Ligand graph from read_ligand_graph()
+        neighbours: List of the (neighbour, rotatable) pairs of each atom
+        labels: Refined atom labels
+
+    Returns:
+        List with the stereo tag of each atom ("" if none)
+    """
+    def sub(a, b):
+        return [a[k] - b[k] for k in range(3)]
+
+    def unit(v):
+        norm = sum(x * x for x in v) ** 0.5 or 1.0
+        return [x / norm for x in v]
+
+    def det(u, v, w):
+        return (u[0] * (v[1] * w[2] - v[2] * w[1]) - u[1] * (v[0] * w[2] - v[2] * w[0])
+                + u[2] * (v[0] * w[1] - v[1] * w[0]))
+
+    tags = [[] for _ in types]
+
+    # Tetrahedral centres (3 heavy neighbours + implicit hydrogen, or 4 neighbours), whose
+    # neighbours all have different labels: sign of the volume of the ordered bond vectors
+    for i, t in enumerate(types):
+        element = AD_ELEMENTS.get(t, t)
+        around = sorted((labels[j], j) for j, _ in neighbours[i])
+        if element not in STEREO_ELEMENTS or not STEREO_ELEMENTS[element] <= len(around) <= 4:
+            continue
+        if len(set(label for label, _ in around)) != len(around):
+            continue
+        volume = det(*(unit(sub(coords[j], coords[i])) for _, j in around[:3]))
+        if abs(volume) >= PLANAR_VOLUME:
+            tags[i].append("@" if volume > 0 else "@@")
+
+    # Double bonds (short and non-rotatable, between non-aromatic atoms): cis/trans
+    # position of the highest-label substituent on each side
+    for (i, j), rotatable in bonds.items():
+        if rotatable or types[i] not in DOUBLE_BOND_TYPES or types[j] not in DOUBLE_BOND_TYPES:
+            continue
+        if dist(coords[i], coords[j]) >= DOUBLE_BOND_LENGTH:
+            continue
+        sides = []
+        for a, b in ((i, j), (j, i)):
+            others = sorted((labels[k], k) for k, _ in neighbours[a] if k != b)
+            if not 1 <= len(others) <= 2 or (len(others) == 2 and others[0][0] == others[1][0]):
+                break
+            sides.append(others[-1][1])
+        if len(sides) != 2:
+            continue
+        axis = unit(sub(coords[j], coords[i]))
+        u = sub(coords[sides[0]], coords[i])
+        w = sub(coords[sides[1]], coords[j])
+        u = [u[k] - sum(u[m] * axis[m] for m in range(3)) * axis[k] for k in range(3)]
+        w = [w[k] - sum(w[m] * axis[m] for m in range(3)) * axis[k] for k in range(3)]
+        tag = "Z" if sum(u[k] * w[k] for k in range(3)) > 0 else "E"
+        tags[i].append(tag)
+        tags[j].append(tag)
+
+    return ["".join(sorted(t)) for t in tags]
+
+
+def ligand_fingerprint(ligand_path):
+    """
+    Compute a canonical fingerprint of a ligand, independent of atom order and coordinates.
+    Atom labels (atom type) are refined with the labels of their neighbours and the
+    rotatable flag of the bonds (Weisfeiler-Lehman) until the partition is stable, then
+    once more with the stereo tags of the atoms, so that stereoisomers differ.
+
+    Args:
+        ligand_path: Path to the ligand PDBQT file
+
+    Returns:
+        Hexadecimal fingerprint
+    """
+    types, bonds, coords = read_ligand_graph(ligand_path)
+
+    neighbours = [[] for _ in types]
+    for (i, j), is_rotatable in bonds.items():
+        neighbours[i].append((j, is_rotatable))
+        neighbours[j].append((i, is_rotatable))
+
+    labels = list(types)
+    history = [sorted(labels)]
+
+    for _ in range(len(types)):
+        new_labels = [
+            hashlib.sha1(
+                (labels[i] + "|" + ",".join(sorted(f"{int(r)}{labels[j]}" for j, r in neighbours[i]))).encode()
+            ).hexdigest()[:16]
+            for i in range(len(types))
+        ]
+        stable = len(set(new_labels)) == len(set(labels))
+        labels = new_labels
+        history.append(sorted(labels))
+        if stable:
+            break
+
+    tags = stereo_tags(types, bonds, coords, neighbours, labels)
+    if any(tags):
+        labels = [
+            hashlib.sha1(
+                (labels[i] + "|" + tags[i] + "|" + ",".join(sorted(f"{int(r)}{labels[j]}" for j, r in neighbours[i]))).encode()
+            ).hexdigest()[:16]
+            for i in range(len(types))
+        ]
+        history.append(sorted(labels))
+
+    digest = hashlib.sha256(f"{len(types)}:{len(bonds)}:{sum(bonds.values())}".encode())
+    for step in history:
+        digest.update(("\n" + " ".join(step)).encode())
+    return digest.hexdigest()
+
+
+def load_fingerprints():
+    """Load the fingerprints computed by previous runs: {name: (mtime_ns, size, fingerprint)}."""
+    cache = {}
+    try:
+        with open(fingerprints_file, "r") as f:
+            if f.readline() != f"#version\t{FINGERPRINT_VERSION}\n":
+                return cache        # computed by another version of the fingerprint
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 4:
+                    cache[parts[0]] = (int(parts[1]), int(parts[2]), parts[3])
+    except (FileNotFoundError, ValueError):
+        pass
+    return cache
+
+
+def load_aliases():
+    """
+    Load the alias table written by deduplicate_ligands().
+
+    Returns:
+        Dictionary alias name -> representative name
+    """
+    aliases = {}
+    try:
+        with open(aliases_file, "r") as f:
+            next(f, None)       # header
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 2:
+                    aliases[parts[0]] = parts[1]
+    except FileNotFoundError:
+        pass
+    return aliases
+
+
+def save_alias_pairs(pairs):
+    """
+    Save the alias pairs planned by a docking run, whose results the analysis copies
+    from the docked ligand. The file is removed when the run has none, so the table
+    of an earlier run is never applied to the results of another one.
+
+    Args:
+        pairs: List of (receptor name, alias name, name the ligand was docked as)
+    """
+    if not pairs:
+        try:
+            alias_pairs_file.unlink()
+        except FileNotFoundError:
+            pass
+        return
+
+    results_folder.mkdir(parents=True, exist_ok=True)
+    tmp_file = alias_pairs_file.with_name(f".{alias_pairs_file.name}.tmp")
+    with open(tmp_file, "w") as f:
+        f.write("Receptor\tAlias\tDocked_As\n")
+        for rec_name, alias, docked_as in pairs:
+            f.write(f"{rec_name}\t{alias}\t{docked_as}\n")
+    os.replace(tmp_file, alias_pairs_file)
+
+
+def load_alias_pairs():
+    """
+    Load the alias pairs saved by the last docking run.
+
+    Returns:
+        List of (receptor name, alias name, name the ligand was docked as)
+    """
+    pairs = []
+    try:
+        with open(alias_pairs_file, "r") as f:
+            next(f, None)       # header
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 3:
+                    pairs.append(tuple(parts))
+    except FileNotFoundError:
+        pass
+    return pairs
+
+
+def deduplicate_ligands(ligands):
+    """
+    Keep one representative per group of identical ligands.
+    Fingerprints are cached by file size and modification time, and the
+    alias -> representative table is saved for the analysis.
+
+    Args:
+        ligands: List of ligand Path objects
+
+    Returns:
+        (representatives, aliases): list of ligand Paths to dock and
+        dictionary alias name -> representative name for this run
+    """
+    cache = load_fingerprints()
+    fingerprints = {}
+    groups = {}
+
+    for ligand in ligands:
+        stat = ligand.stat()
+        cached = cache.get(ligand.stem)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            fingerprint = cached[2]
+        else:
+            try:
+                fingerprint = ligand_fingerprint(ligand)
+            except (ValueError, IndexError, KeyError):
+                fingerprint = f"unreadable:{ligand.stem}"     # never merged with another ligand
+            cache[ligand.stem] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+        fingerprints[ligand.stem] = fingerprint
+        groups.setdefault(fingerprint, []).append(ligand)
+
+    representatives = []
+    aliases = {}
+
+    for group in groups.values():
+        representative = min(group, key=lambda p: p.stem)      # stable choice across runs
+        representatives.append(representative)
+        for ligand in group:
+            if ligand is not representative:
+                aliases[ligand.stem] = representative.stem
+
+    representatives.sort()
+
+    # Save the fingerprint cache and the alias table (aliases of ligands that are
+    # not part of this run are kept, the ones of this run are replaced)
+    results_folder.mkdir(parents=True, exist_ok=True)
+
+    tmp_file = fingerprints_file.with_name(f"{fingerprints_file.name}.tmp")
+    with open(tmp_file, "w") as f:
+        f.write(f"#version\t{FINGERPRINT_VERSION}\n")
+        for name, (mtime, size, fingerprint) in cache.items():
+            f.write(f"{name}\t{mtime}\t{size}\t{fingerprint}\n")
+    os.replace(tmp_file, fingerprints_file)
+
+    all_aliases = {alias: rep for alias, rep in load_aliases().items() if alias not in fingerprints}
+    all_aliases.update(aliases)
+
+    tmp_file = aliases_file.with_name(f".{aliases_file.name}.tmp")
+    with open(tmp_file, "w") as f:
+        f.write("Alias\tRepresentative\n")
+        for alias, rep in sorted(all_aliases.items()):
+            f.write(f"{alias}\t{rep}\n")
+    os.replace(tmp_file, aliases_file)
+
+    return representatives, aliases
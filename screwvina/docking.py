@@ -4,33 +4,38 @@ docking.py - Docking Module
 Contains the main docking workflow function.
 """
 
+import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-from config import receptors_folder, ligands_folder, results_folder
-from file_utils import find_pdbqt, find_configuration
+from config import receptors_folder, ligands_folder, results_folder, maps_cache_folder
+from file_utils import find_pdbqt, find_configuration, resolve_configuration, read_pairs
 from vina_execution import vina_execution
 from cpu_utils import get_system_cores, read_cpu_from_config, check_cpu_usage, calculate_optimal_jobs
+from cpu_utils import ADAPTIVE_INTERVAL, ADAPTIVE_COOLDOWN, read_system_load, adaptive_jobs, format_system_load
+from map_cache import prepare_maps, evict_maps
+from ligand_prep import HAS_MEEKO, stream_ligands
+from dedup import deduplicate_ligands, save_alias_pairs
 
 
 
-def filter_files(files, name_filter, list_file, file_type):
+def read_name_filter(name_filter, list_file, file_type):
     """
-    Filter files based on name filter or list file.
+    Build the set of names selected by a name filter and/or a list file.
     
     Args:
-        files: List of Path objects
         name_filter: List of filenames (without extension) or None
-        ligand_filter: List of filenames (without extension) or None
         list_file: Path to file containing list of names or None
         file_type: String describing file type (for messages)
     
     Returns:
-        Filtered list of Path objects
+        Set of names to include, or None if no filter is given
     """
-    # If no filter, return all
+    # If no filter, include all
     if name_filter is None and list_file is None:
-        return files
+        return None
     
     # Create set of names to include
     include_names = set()
@@ -43,7 +48,6 @@ def filter_files(files, name_filter, list_file, file_type):
     # From list file
     if list_file:
         try:
-            from pathlib import Path
             list_path = Path(list_file)
             with open(list_path, 'r') as f:
                 names_from_file = [
@@ -55,6 +59,28 @@ def filter_files(files, name_filter, list_file, file_type):
                 print(f"Loaded {len(names_from_file)} {file_type} from {list_file}")
         except FileNotFoundError:
             print(f"WARNING: List file {list_file} not found, ignoring")
+
+    return include_names
+
+
+def filter_files(files, name_filter, list_file, file_type):
+    """
+    Filter files based on name filter or list file.
+    
+    Args:
+        files: List of Path objects
+        name_filter: List of filenames (without extension) or None
+        list_file: Path to file containing list of names or None
+        file_type: String describing file type (for messages)
+    
+    Returns:
+        Filtered list of Path objects
+    """
+    include_names = read_name_filter(name_filter, list_file, file_type)
+
+    # If no filter, return all
+    if include_names is None:
+        return files
     
     # Filter the files
     filtered = [f for f in files if f.stem in include_names]
@@ -92,10 +118,323 @@ def is_valid_output(output_pdbqt, output_log):
 
 
 
+def plan_receptors(receptors, global_config=None, require_config=True):
+    """
+    Collect the configuration and output folders of each receptor.
+    Receptors without a configuration are reported and skipped.
+    
+    Args:
+        receptors: List of receptor Path objects
+        global_config: Optional path to a global/master configuration file
+        require_config: If False, receptors without a configuration are kept
+            (with config None), for pairs that provide their own configuration
+        
+    Returns:
+        List of dictionaries, one per receptor
+    """
+    plans = []
+
+    for receptor in receptors:
+        rec_name = receptor.stem    # name without extension
+        
+        try: 
+            config = find_configuration(rec_name, global_config)
+        except FileNotFoundError as e:
+            if require_config:
+                print(e)
+                continue
+            config = None
+
+        rec_folder = results_folder / f"vs_{rec_name}"      # creates subfolder with receptor-specific results
+
+        plans.append({
+            "receptor": receptor,
+            "name": rec_name,
+            "config": config,
+            "rec_folder": rec_folder,
+            "log_folder": rec_folder / "logs",              # creates subsubfolder for log files of the given receptor
+            "maps": None
+        })
+
+    return plans
+
+
+def output_name(lig_name, config=None):
+    """Name of the outputs of a ligand: <ligand>, or <ligand>@<config> with a configuration override."""
+    return lig_name if config is None else f"{lig_name}@{config.stem}"
+
+
+def make_task(plan, ligand, config=None, name=None):
+    """
+    Create the docking task of a receptor/ligand pair.
+    
+    Args:
+        plan: Receptor dictionary from plan_receptors()
+        ligand: Path to the ligand PDBQT file
+        config: Optional configuration overriding the receptor one. Its outputs are
+                named <ligand>@<config> so that they never mix with the default docking
+        name: Ligand name of the outputs, if not the file name (alias of a deduplicated ligand)
+        
+    Returns:
+        Task dictionary, or None if the docking has already been executed
+    """
+    lig_name = output_name(name or ligand.stem, config)
+
+    output_pdbqt = plan["rec_folder"] / f"{lig_name}_out.pdbqt"
+    output_log = plan["log_folder"] / f"{plan['name']}_{lig_name}.log"
+
+    # Check if output is valid (exists and not empty/corrupted)
+    if is_valid_output(output_pdbqt, output_log):
+        return None
+
+    return {
+        "receptor": plan["receptor"], 
+        "ligand": ligand, 
+        "config": config or plan["config"], 
+        "output_pdbqt": output_pdbqt, 
+        "output_log": output_log,
+        "maps": None if config else plan["maps"]
+    }
+
+
+def cached_maps(receptor, config, vina_exe, memo, maps_in_use):
+    """
+    Return the cached maps of a receptor/configuration combination, preparing them once per run.
+    
+    Args:
+        receptor: Path to the receptor PDBQT file
+        config: Path to the configuration file
+        vina_exe: Vina executable name or path
+        memo: Dictionary of the maps already prepared in this run
+        maps_in_use: Set collecting the cache keys used in this run
+        
+    Returns:
+        Maps prefix, or None if the maps could not be cached
+    """
+    if (receptor, config) not in memo:
+        key, maps_prefix = prepare_maps(receptor, config, vina_exe)
+        if maps_prefix is None:
+            print(f"WARNING: Maps for {receptor.stem} ({config.name}) could not be cached, docking against the receptor")
+        else:
+            maps_in_use.add(key)
+        memo[(receptor, config)] = maps_prefix
+
+    return memo[(receptor, config)]
+
+
+def pair_tasks(pairs_file, plans, ligands, maps_for=None, alias_pairs=None):
+    """
+    Create the docking tasks listed in a pair manifest, as the manifest is read.
+    Names are validated with dictionary lookups against the available files.
+    
+    Args:
+        pairs_file: Path to the pair manifest (see read_pairs())
+        plans: Dictionary of receptor name -> receptor dictionary from plan_receptors()
+        ligands: Dictionary of ligand name -> ligand Path
+        maps_for: Optional function (receptor, config) -> maps prefix
+        alias_pairs: Optional list collecting the (receptor, alias, docked as) output names of
+                     the listed pairs whose ligand is already docked under another name
+        
+    Yields:
+        Task dictionaries of the pairs still to be docked
+    """
+    seen = set()    # pairs (and configurations) listed so far
+    docked = {}     # pairs planned so far -> ligand name of their outputs (first listed name of a deduplicated group)
+    configs = {}    # resolved per-pair configurations
+    skipped = 0
+    planned = 0
+
+    def skip(line_number, reason):
+        nonlocal skipped
+        skipped += 1
+        if skipped <= 10:
+            print(f"WARNING: {Path(pairs_file).name}:{line_number}: {reason}, skipping")
+
+    for line_number, rec_name, lig_name, config_name in read_pairs(pairs_file):
+        plan = plans.get(rec_name)
+        if plan is None:
+            skip(line_number, f"receptor '{rec_name}' not available")
+            continue
+        ligand = ligands.get(lig_name)
+        if ligand is None:
+            skip(line_number, f"ligand '{lig_name}' not available")
+            continue
+
+        config = None
+        if config_name is not None:
+            if config_name not in configs:
+                try:
+                    configs[config_name] = resolve_configuration(config_name)
+                except FileNotFoundError:
+                    configs[config_name] = None
+            config = configs[config_name]
+            if config is None:
+                skip(line_number, f"configuration '{config_name}' not found")
+                continue
+        elif plan["config"] is None:
+            skip(line_number, f"no configuration for receptor '{rec_name}'")
+            continue
+
+        if config is not None and plan["config"] is not None and config.resolve() == plan["config"].resolve():
+            config = None       # same as the receptor configuration: not an override
+
+        if (rec_name, lig_name, config) in seen:
+            skip(line_number, f"duplicate pair {rec_name}/{lig_name}")
+            continue
+        seen.add((rec_name, lig_name, config))
+        key = (rec_name, ligand.stem, config)
+        if key in docked:       # aliases of a deduplicated ligand are docked once
+            if alias_pairs is not None:
+                alias_pairs.append((rec_name, output_name(lig_name, config), output_name(docked[key], config)))
+            continue
+        docked[key] = lig_name
+
+        planned += 1
+        task = make_task(plan, ligand, config, name=lig_name)
+        if task is None:
+            continue
+
+        if maps_for is not None:
+            task["maps"] = maps_for(task["receptor"], task["config"])
+
+        yield task
+
+    print(f"Pair manifest: {planned} pairs planned, {skipped} skipped")
+
+
+def run_task(task, vina_exe, new_session=False):
+    """Execute the docking of a task dictionary and return the Vina return code."""
+    return vina_execution(
+        task["receptor"],
+        task["ligand"],
+        task["config"],
+        task["output_pdbqt"],
+        task["output_log"],
+        vina_exe,
+        task["maps"],
+        new_session
+    )
+
+
+def run_tasks(tasks, num_jobs, vina_exe, total=None, adaptive=False):
+    """
+    Execute docking tasks, serially or num_jobs at a time.
+    Tasks are consumed lazily, so they may come from a generator that is still
+    producing them (at most 2 x num_jobs tasks are submitted ahead).
+    
+    In adaptive mode num_jobs is an upper bound: the number of Vina processes
+    in flight starts at half of it and follows the system load (see adaptive_jobs()).
+    
+    Args:
+        tasks: Iterable of task dictionaries
+        num_jobs: Number of parallel docking jobs
+        vina_exe: Vina executable name or path
+        total: Number of tasks, if known (for progress messages)
+        adaptive: Adjust the number of parallel jobs to the system load
+        
+    Returns:
+        (success, failed) counts
+    """
+    success = 0
+    failed = 0
+    completed = 0
+
+    def progress():
+        # showing progress every 25 docking processes and at the end
+        if completed % 25 == 0 or completed == total:
+            done = f"{completed}/{total}" if total is not None else f"{completed}"
+            print(f"Progress: {done} (ok={success}, errors={failed})")
+
+    if num_jobs == 1:
+        print("\nExecuting one docking at a time...")       # serial mode
+        for task in tasks:
+            code = run_task(task, vina_exe)
+            completed += 1
+
+            if code == 0:
+                success += 1
+            else:
+                failed += 1
+
+            progress()
+    
+    else:
+        limit = max(1, num_jobs // 2) if adaptive else num_jobs
+
+        if adaptive:
+            print(f"\nExecuting {limit} to {num_jobs} docking processes at a time (adaptive)...")
+        else:
+            print(f"\nExecuting {num_jobs} docking processes at a time...")      # parallel mode
+
+        system_cores = get_system_cores()
+        last_check = time.time()
+        last_decrease = None
+
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+
+            pending = set()
+            task_iter = iter(tasks)
+            exhausted = False
+
+            while pending or not exhausted:
+                # keep the executor fed without materializing every future up front
+                # (in adaptive mode, nothing is queued beyond the running processes)
+                while not exhausted and len(pending) < (limit if adaptive else 2 * num_jobs):
+                    task = next(task_iter, None)
+                    if task is None:
+                        exhausted = True
+                    else:
+                        pending.add(executor.submit(run_task, task, vina_exe))
+
+                if not pending:
+                    break
+
+                done, pending = wait(
+                    pending,
+                    timeout=ADAPTIVE_INTERVAL if adaptive else None,
+                    return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    code = future.result()
+                    completed += 1
+
+                    if code == 0:
+                        success += 1
+                    else:
+                        failed += 1
+
+                    progress()
+
+                # raise or lower the number of running processes (running ones are never stopped,
+                # so after a decrease the load only drops once the extra processes have finished:
+                # no further decrease before then, nor before the load average has caught up)
+                if adaptive and time.time() - last_check >= ADAPTIVE_INTERVAL:
+                    last_check = time.time()
+                    load = read_system_load(system_cores)
+                    new_limit, reason = adaptive_jobs(limit, 1, num_jobs, load)
+                    if new_limit < limit:
+                        if len(pending) > limit or (
+                                last_decrease is not None and last_check - last_decrease < ADAPTIVE_COOLDOWN):
+                            new_limit = limit
+                        else:
+                            last_decrease = last_check
+                    if new_limit != limit:
+                        print(f"[{time.strftime('%H:%M:%S')}] Parallel jobs: {limit} -> {new_limit} "
+                              f"({reason}; {format_system_load(load)})")
+                        limit = new_limit
+
+    if total is None and completed % 25 != 0:
+        print(f"Progress: {completed} (ok={success}, errors={failed})")
+
+    return success, failed
+
+
 def vina_docking(vina_exe="vina", num_jobs=None,
                  receptor_filter=None, ligand_filter=None,
                  receptor_list_file=None, ligand_list_file=None,
-                 global_config=None):
+                 global_config=None, map_cache=False, map_cache_size=2048,
+                 prepare_input=None, prep_workers=None, pairs_file=None,
+                 adaptive=False, dedup=False):
 
     # Some fancy display messages and appearance settings:
     print("=" * 70)
@@ -103,18 +442,40 @@ def vina_docking(vina_exe="vina", num_jobs=None,
     print("=" * 70)
 
 
-    # Step 1: Find all ligands using the previously defined function find_pdbqt() and folder with ligands:
+    # Step 1: Find all ligands using the previously defined function find_pdbqt() and folder with ligands
+    #         (or, with prepare_input, prepare them from a SMILES/SDF library while docking runs):
 
-    ligands = find_pdbqt(ligands_folder)
-    if not ligands:
-        print(f"ERROR: No ligand found in {ligands_folder}")
-        return
-    
-    # Step 1.1: Ligands filtering
-    ligands = filter_files(ligands, ligand_filter, ligand_list_file, "ligands")
-    if not ligands:
-        print(f"ERROR: No ligands match the specified filter")
+    if prepare_input is not None and pairs_file is not None:
+        print("ERROR: Ligand preparation and pair manifests cannot be combined")
         return
+
+    if prepare_input is None:
+        ligands = find_pdbqt(ligands_folder)
+        if not ligands:
+            print(f"ERROR: No ligand found in {ligands_folder}")
+            return
+        
+        # Step 1.1: Ligands filtering
+        ligands = filter_files(ligands, ligand_filter, ligand_list_file, "ligands")
+        if not ligands:
+            print(f"ERROR: No ligands match the specified filter")
+            return
+
+        # Step 1.2: Only one ligand per group of identical molecules is docked,
+        #           the analysis copies its results to the other ones (aliases)
+        aliases = {}
+        if dedup:
+            ligands, aliases = deduplicate_ligands(ligands)
+            print(f"Deduplication: {len(ligands)} unique ligands, {len(aliases)} aliases skipped")
+
+    else:
+        if not HAS_MEEKO:
+            print("ERROR: Ligand preparation requires RDKit and Meeko (conda install -c conda-forge rdkit meeko)")
+            return
+        ligands = None
+        ligand_names = read_name_filter(ligand_filter, ligand_list_file, "ligands")
+        if dedup:
+            print("WARNING: Deduplication is not available with ligand preparation, ignoring")
     
 
     # Step 2: Find all receptors using the same find_pdbqt() function and the receptor folder:
@@ -138,46 +499,70 @@ def vina_docking(vina_exe="vina", num_jobs=None,
 
     # Step 4: Prepare the list of all docking operations to carry out:
 
-    tasks = [] # list initialization (now empty)
-    
+    plans = plan_receptors(receptors, global_config, require_config=pairs_file is None)
+    if not plans:
+        print("ERROR: No receptor has a configuration file")
+        return
+
     # Get system cores for CPU check
     system_cores = get_system_cores()
 
-    for receptor in receptors:
-        rec_name = receptor.stem    # name without extension
-        
-        try: 
-            config = find_configuration(rec_name, global_config)
-        except FileNotFoundError as e:
-            print(e)
-            continue
-
-        rec_folder = results_folder / f"vs_{rec_name}"      # creates subfolder with receptor-specific results
-        log_folder = rec_folder / "logs"                    # creates subsubfolder for log files of the given receptor
-
-
-        for ligand in ligands:
-            lig_name = ligand.stem
+    # Cache keys of the maps used by this run (never evicted)
+    maps_in_use = set()
+    maps_for = partial(cached_maps, vina_exe=vina_exe, memo={}, maps_in_use=maps_in_use) if map_cache else None
+
+    # Alias pairs of this run: the analysis copies their results from the docked ligand
+    # (the table of a previous run is removed, it does not describe this plan)
+    alias_pairs = []
+
+    if pairs_file is not None:
+        # Only the pairs listed in the manifest, planned while it is read
+        # (the alias pairs are saved once the manifest has been read)
+        save_alias_pairs([])
+        tasks = pair_tasks(
+            pairs_file,
+            {plan["name"]: plan for plan in plans},
+            {**{ligand.stem: ligand for ligand in ligands},
+             **{alias: ligands_folder / f"{rep}.pdbqt" for alias, rep in aliases.items()}},
+            maps_for,
+            alias_pairs
+        )
+        total = None
+
+    elif ligands is not None:
+        tasks = [] # list initialization (now empty)
+        for plan in plans:
+            plan["tasks"] = [task for task in (make_task(plan, ligand) for ligand in ligands) if task]
+            tasks.extend(plan["tasks"])
+            alias_pairs.extend((plan["name"], alias, rep) for alias, rep in aliases.items())
+        total = len(tasks)
+        save_alias_pairs(alias_pairs)
 
-            output_pdbqt = rec_folder / f"{lig_name}_out.pdbqt"
-            output_log = log_folder / f"{rec_name}_{lig_name}.log"
+    else:
+        save_alias_pairs([])
 
-            # Check if output is valid (exists and not empty/corrupted)
-            if is_valid_output(output_pdbqt, output_log):
+    # Step 4.1: Reuse (or compute once) the affinity maps of each receptor/box combination
+    #           (pair manifests prepare them when a combination is first listed)
+    if map_cache and pairs_file is None:
+        for plan in plans:
+            if ligands is not None and not plan["tasks"]:      # nothing left to dock on this receptor
                 continue
-                
-            tasks.append({
-                "receptor": receptor, 
-                "ligand": ligand, 
-                "config": config, 
-                "output_pdbqt": output_pdbqt, 
-                "output_log": output_log
-            })
+            plan["maps"] = maps_for(plan["receptor"], plan["config"])
+            for task in plan.get("tasks", []):
+                task["maps"] = plan["maps"]
+
+    # Step 4.2: With ligand preparation, tasks are created as soon as each ligand is ready
+    if ligands is None:
+        if prep_workers is None:
+            prep_workers = max(1, system_cores // 4)
+        prepared = stream_ligands(prepare_input, workers=prep_workers, name_filter=ligand_names)
+        tasks = (task for ligand in prepared for task in (make_task(plan, ligand) for plan in plans) if task)
+        total = None
 
 
     # Step 5: Verifies if there is something to do
 
-    if not tasks:
+    if total == 0:
         print("It seems like all dockings have already been executed.")
         print("=" * 70)
         return
@@ -186,32 +571,54 @@ def vina_docking(vina_exe="vina", num_jobs=None,
     # Step 6: CPU resource check and automatic job calculation
     
     # Read CPU from first config file
-    first_config = tasks[0]["config"]
-    config_cpu = read_cpu_from_config(first_config)
+    first_config = next((plan["config"] for plan in plans if plan["config"] is not None), None)
+    config_cpu = read_cpu_from_config(first_config) if first_config is not None else 1
     
     # If num_jobs not specified, calculate optimal value
     if num_jobs is None:
         num_jobs = calculate_optimal_jobs(config_cpu, system_cores)
         print(f"Auto-detected optimal parallel jobs: {num_jobs} (based on {system_cores} cores and config CPU={config_cpu})")
+    elif adaptive:
+        # num_jobs is only an upper bound, but it is still capped to what the node can run
+        is_ok, warning = check_cpu_usage(config_cpu, num_jobs, system_cores)
+        if not is_ok:
+            print(warning)
+            num_jobs = calculate_optimal_jobs(config_cpu, system_cores)
+            print(f"Adaptive mode: at most {num_jobs} parallel jobs")
     else:
         # Check if user-specified num_jobs would cause overload
         is_ok, warning = check_cpu_usage(config_cpu, num_jobs, system_cores)
         if not is_ok:
             print(warning)
-            print("Do you want to continue anyway? (yes/no): ", end="")
-            response = input().strip().lower()
-            if response not in ['yes', 'y']:
-                print("Aborted by user.")
-                return
+            if not sys.stdin.isatty():      # unattended run: never wait for an answer
+                print("Continuing with the requested jobs (use --adaptive to follow the system load).")
+            else:
+                print("Do you want to continue anyway? (yes/no): ", end="")
+                response = input().strip().lower()
+                if response not in ['yes', 'y']:
+                    print("Aborted by user.")
+                    return
 
 
     # Step 7: Display summary
 
     print(f"Receptors: {len(receptors)}")
-    print(f"Ligands: {len(ligands)}")
-    print(f"Dockings to perform: {len(tasks)}")
-    print(f"Parallel jobs: {num_jobs}")
+    if pairs_file is not None:
+        print(f"Ligands: {len(ligands)} available")
+        print(f"Dockings to perform: pairs listed in {pairs_file}")
+    elif ligands is not None:
+        print(f"Ligands: {len(ligands)}")
+        print(f"Dockings to perform: {total}")
+    else:
+        print(f"Ligands: prepared from {prepare_input} ({prep_workers} preparation processes)")
+        print(f"Dockings to perform: determined as ligands become ready")
+    if adaptive:
+        print(f"Parallel jobs: adaptive, up to {num_jobs}")
+    else:
+        print(f"Parallel jobs: {num_jobs}")
     print(f"Config CPU per job: {config_cpu}")
+    if map_cache:
+        print(f"Map cache: {maps_cache_folder} ({len(maps_in_use)} maps ready)")
     print(f"Output folder: {results_folder}")
     print("=" * 70)
 
@@ -219,59 +626,13 @@ def vina_docking(vina_exe="vina", num_jobs=None,
     # Step 8: Docking execution
 
     start = time.time()
-    success = 0
-    failed = 0
-
-    if num_jobs == 1:
-        print("\nExecuting one docking at a time...")       # serial mode
-        for i, task in enumerate(tasks, 1):
-            code = vina_execution(
-                task["receptor"],
-                task["ligand"],
-                task["config"],
-                task["output_pdbqt"],
-                task["output_log"],
-                vina_exe
-            )
-
-            if code == 0:
-                success += 1
-            else:
-                failed += 1
-
-            if i % 25 == 0 or i == len(tasks):
-                print(f"Progress: {i}/{len(tasks)} (ok={success}, errors={failed})")        # showing profress every 25 docking processes and at the end
-    
-    else:
-        print(f"\nExecuting {num_jobs} docking processes at a time...")      # parallel mode
-
-        with ThreadPoolExecutor(max_workers=num_jobs) as executor:      # send all dockings to the executor function
-
-            futures = []
-            for task in tasks:
-                future = executor.submit(
-                    vina_execution,
-                    task["receptor"],
-                    task["ligand"],
-                    task["config"],
-                    task["output_pdbqt"],
-                    task["output_log"],
-                    vina_exe
-                )
-                futures.append(future)
-
-            completed = 0   # initializing list of results as they are collected
-            for future in as_completed(futures):
-                code = future.result()
-                completed += 1
-
-                if code == 0:
-                    success += 1
-                else:
-                    failed += 1
+    success, failed = run_tasks(tasks, num_jobs, vina_exe, total, adaptive)
+    if pairs_file is not None:
+        save_alias_pairs(alias_pairs)
 
-                if completed % 25 == 0 or completed == len(futures):
-                    print(f"Progress: {completed}/{len(futures)} (ok={success}, errors={failed})")
+    # Step 8.1: Keep the map cache within its size limit
+    if map_cache:
+        evict_maps(maps_cache_folder, map_cache_size * 1024 * 1024, keep=maps_in_use)
 
 
     # Step 9: Show final results
@@ -4,6 +4,11 @@ file_utils.py - File Utilities Module
 Contains functions for finding files and configurations.
 """
 
+import csv
+import gzip
+from itertools import chain
+from pathlib import Path
+
 from config import configurations_folder
 
 # ==========================================================================================================================================================================
@@ -43,7 +48,6 @@ def find_configuration(receptor_name, global_config=None):
     
     # Fall back to global config if provided
     if global_config is not None:
-        from pathlib import Path
         global_path = Path(global_config)
         if global_path.exists():
             return global_path
@@ -55,3 +59,92 @@ def find_configuration(receptor_name, global_config=None):
         f"Error: Configuration for '{receptor_name}' not found. "
         f"Expected: {specific_config} or use --global-config option."
     )
+
+# ==========================================================================================================================================================================
+# ==========================================================================================================================================================================
+
+def read_config_values(config_path):
+    """
+    Read all key = value pairs from a Vina configuration file.
+    Inline comments (after '#') and blank lines are ignored.
+    
+    Args:
+        config_path: Path to the configuration file
+        
+    Returns:
+        Dictionary mapping option names to their (string) values
+    """
+    values = {}
+
+    with open(config_path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            values[key.strip()] = value.strip()
+
+    return values
+
+# ==========================================================================================================================================================================
+# ==========================================================================================================================================================================
+
+def resolve_configuration(config_name):
+    """
+    Find a configuration file given as a path or as a name in the configurations folder.
+    
+    Args:
+        config_name: Path to the file, or file name (with or without .txt) in configurations/
+        
+    Returns:
+        Path to configuration file
+        
+    Raises:
+        FileNotFoundError: If no configuration is found
+    """
+    for candidate in (Path(config_name),
+                      configurations_folder / config_name,
+                      configurations_folder / f"{config_name}.txt"):
+        if candidate.is_file():
+            return candidate
+
+    raise FileNotFoundError(f"Error: Configuration file '{config_name}' not found.")
+
+# ==========================================================================================================================================================================
+# ==========================================================================================================================================================================
+
+def read_pairs(pairs_file):
+    """
+    Read a receptor/ligand pair manifest as a stream.
+    The manifest is a TSV or CSV file (optionally gzipped) with the columns
+    receptor, ligand and, optionally, a configuration overriding the receptor one.
+    Names are given without extension; an optional header line and lines
+    starting with '#' are skipped.
+    
+    Args:
+        pairs_file: Path to the manifest
+        
+    Yields:
+        (line_number, receptor_name, ligand_name, config_name or None)
+    """
+    pairs_path = Path(pairs_file)
+    opener = gzip.open if pairs_path.suffix.lower() == ".gz" else open
+
+    with opener(pairs_path, "rt", newline="") as f:
+        first = f.readline()
+        delimiter = "\t" if "\t" in first or ".tsv" in pairs_path.name.lower() else ","
+
+        rows = csv.reader(chain([first], f), delimiter=delimiter)
+
+        for line_number, row in enumerate(rows, 1):
+            row = [field.strip() for field in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if line_number == 1 and row[0].lower() == "receptor":      # header
+                continue
+            if len(row) < 2 or not row[1]:
+                print(f"WARNING: {pairs_path.name}:{line_number}: expected 'receptor ligand [config]', skipping")
+                continue
+
+            config_name = row[2] if len(row) > 2 and row[2] else None
+            yield line_number, row[0], row[1], config_name
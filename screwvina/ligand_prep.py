@@ -0,0 +1,328 @@
+"""
+ligand_prep.py - Ligand Preparation Module
+
+Contains the functions to convert SMILES/SDF libraries to PDBQT with
+RDKit/Meeko and to stream the prepared ligands to the docking step.
+"""
+
+import glob
+import gzip
+import hashlib
+import multiprocessing
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from config import ligands_folder, prep_cache_folder, results_folder
+
+try:
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+    from meeko import MoleculePreparation
+    HAS_MEEKO = True
+except ImportError:
+    HAS_MEEKO = False
+
+
+PREP_VERSION = "1"      # bump to invalidate the cache when the preparation protocol changes
+
+SMILES_SUFFIXES = [".smi", ".smiles"]
+SDF_SUFFIXES = [".sdf", ".mol"]
+
+
+def input_format(path):
+    """
+    Detect the format of a molecule file from its extension (.gz allowed).
+
+    Args:
+        path: Path to the input file
+
+    Returns:
+        "smi", "sdf" or None if the format is not supported
+    """
+    suffixes = [s.lower() for s in path.suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    if not suffixes:
+        return None
+    if suffixes[-1] in SMILES_SUFFIXES:
+        return "smi"
+    if suffixes[-1] in SDF_SUFFIXES:
+        return "sdf"
+    return None
+
+
+def safe_name(name):
+    """Turn a molecule title into a valid file name."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "-", name.strip())
+
+
+def read_molecules(input_path):
+    """
+    Read the molecules of a SMILES/SDF file (or of all such files in a folder) as a stream.
+    Records are not parsed here, so that parsing happens in the worker processes.
+
+    Args:
+        input_path: Path to a molecule file or to a folder of molecule files
+
+    Yields:
+        (name, fmt, record) tuples, where record is the raw SMILES or SDF block
+    """
+    input_path = Path(input_path)
+
+    if input_path.is_dir():
+        files = sorted(p for p in input_path.iterdir() if input_format(p) is not None)
+    else:
+        files = [input_path]
+
+    for path in files:
+        fmt = input_format(path)
+        if fmt is None:
+            print(f"WARNING: Unsupported molecule file {path}, skipping")
+            continue
+
+        opener = gzip.open if path.suffix.lower() == ".gz" else open
+
+        with opener(path, "rt") as f:
+            if fmt == "smi":
+                for i, line in enumerate(f, 1):
+                    parts = line.split()
+                    if not parts or parts[0].startswith("#"):
+                        continue
+                    name = parts[1] if len(parts) > 1 else f"{path.stem}-{i}"
+                    yield safe_name(name), fmt, parts[0]
+            else:
+                block = []
+                count = 0
+                for line in f:
+                    block.append(line)
+                    if line.startswith("$$$$"):
+                        count += 1
+                        name = block[0].strip() or f"{path.stem}-{count}"
+                        yield safe_name(name), fmt, "".join(block)
+                        block = []
+                # last record without a $$$$ line (always the case for MOL files)
+                if any(line.startswith("M  END") for line in block):
+                    count += 1
+                    name = block[0].strip() or f"{path.stem}-{count}"
+                    yield safe_name(name), fmt, "".join(block)
+                elif any(line.strip() for line in block):
+                    print(f"WARNING: Incomplete record at the end of {path} (no M  END line), skipping")
+
+
+def record_hash(fmt, record):
+    """Cache key of a molecule record."""
+    return hashlib.sha256(f"{PREP_VERSION}\n{fmt}\n{record}".encode()).hexdigest()
+
+
+def prepare_record(fmt, record):
+    """
+    Convert one molecule record to a PDBQT string (runs in a worker process).
+
+    Args:
+        fmt: "smi" or "sdf"
+        record: Raw SMILES string or SDF block
+
+    Returns:
+        PDBQT content as a string
+
+    Raises:
+        ValueError: If the molecule cannot be parsed, embedded or written
+    """
+    if fmt == "smi":
+        mol = Chem.MolFromSmiles(record)
+        if mol is None:
+            raise ValueError("invalid SMILES")
+        mol = Chem.AddHs(mol)
+    else:
+        mol = Chem.MolFromMolBlock(record, removeHs=False)
+        if mol is None:
+            raise ValueError("invalid SDF record")
+        mol = Chem.AddHs(mol, addCoords=True)
+
+    if mol.GetNumConformers() == 0 or not mol.GetConformer().Is3D():     # 3D coordinates are required
+        if AllChem.EmbedMolecule(mol, randomSeed=0xf00d) != 0:
+            raise ValueError("3D embedding failed")
+        AllChem.MMFFOptimizeMolecule(mol)
+
+    preparator = MoleculePreparation()
+
+    if hasattr(preparator, "write_pdbqt_string"):       # Meeko < 0.5
+        preparator.prepare(mol)
+        return preparator.write_pdbqt_string()
+
+    from meeko import PDBQTWriterLegacy
+    setups = preparator.prepare(mol)
+    pdbqt, is_ok, error = PDBQTWriterLegacy.write_string(setups[0])
+    if not is_ok:
+        raise ValueError(error)
+    return pdbqt
+
+
+def write_atomic(path, text):
+    """Write a file through a temporary name, so readers never see it half-written."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def invalidate_ligand_outputs(name):
+    """Remove the docking outputs of a ligand for every receptor, so that it is docked again."""
+    if not results_folder.exists():
+        return
+    for directory in results_folder.glob("vs_*"):
+        rec_name = directory.name.replace("vs_", "", 1)
+        paths = [directory / f"{name}_out.pdbqt", directory / "logs" / f"{rec_name}_{name}.log"]
+        # outputs of the pairs docked with a configuration override (<ligand>@<config>)
+        paths += directory.glob(f"{glob.escape(name)}@*_out.pdbqt")
+        paths += (directory / "logs").glob(f"{glob.escape(rec_name)}_{glob.escape(name)}@*.log")
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def publish_ligand(name, pdbqt, output_folder):
+    """
+    Place a prepared ligand in the ligand folder (unchanged files are not rewritten).
+    If the file held a different molecule, its previous docking outputs are removed.
+    """
+    ligand = output_folder / f"{name}.pdbqt"
+    try:
+        with open(ligand, "r") as f:
+            if f.read() == pdbqt:
+                return ligand
+        invalidate_ligand_outputs(name)     # same name, new molecule: old results are stale
+    except FileNotFoundError:
+        pass
+    write_atomic(ligand, pdbqt)
+    return ligand
+
+
+def put_ready(ready, item, stop_event):
+    """Put an item in the queue, blocking while docking is behind but giving up once stopped."""
+    while not stop_event.is_set():
+        try:
+            ready.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def produce_ligands(input_path, workers, name_filter, output_folder, cache_folder, ready, stop_event, errors):
+    """
+    Producer side of the pipeline (runs in a background thread).
+    Converts the molecules in a process pool, with at most 2 x workers conversions in flight,
+    and puts every prepared ligand path in the ready queue, followed by None at the end.
+    """
+    pending = {}
+    seen = set()
+    stats = {"prepared": 0, "cached": 0, "failed": 0}
+
+    def finish(future, name, key):
+        try:
+            pdbqt = future.result()
+        except Exception as e:
+            print(f"WARNING: Preparation of {name} failed: {e}")
+            stats["failed"] += 1
+            return
+        write_atomic(cache_folder / f"{key}.pdbqt", pdbqt)
+        stats["prepared"] += 1
+        put_ready(ready, publish_ligand(name, pdbqt, output_folder), stop_event)
+
+    # This thread runs next to the docking threads, which start Vina processes: workers are
+    # started from a clean server process instead of forking the whole multithreaded parent
+    context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                                          else "spawn")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            for name, fmt, record in read_molecules(input_path):
+                if stop_event.is_set():
+                    break
+                if name_filter is not None and name not in name_filter:
+                    continue
+                if name in seen:
+                    print(f"WARNING: Duplicate ligand name {name} in {input_path}, skipping")
+                    continue
+                seen.add(name)
+
+                # Already converted in a previous run: no need to prepare it again
+                key = record_hash(fmt, record)
+                cached = cache_folder / f"{key}.pdbqt"
+                if cached.exists():
+                    stats["cached"] += 1
+                    put_ready(ready, publish_ligand(name, cached.read_text(), output_folder), stop_event)
+                    continue
+
+                pending[executor.submit(prepare_record, fmt, record)] = (name, key)
+
+                while len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future, *pending.pop(future))
+
+            for future in list(pending):
+                if stop_event.is_set():
+                    future.cancel()
+                else:
+                    finish(future, *pending.pop(future))
+
+    except Exception as e:
+        errors.append(e)
+
+    finally:
+        print(f"Ligand preparation: {stats['prepared']} prepared, "
+              f"{stats['cached']} from cache, {stats['failed']} failed")
+        put_ready(ready, None, stop_event)      # end of stream
+
+
+def stream_ligands(input_path, workers=1, name_filter=None, output_folder=ligands_folder,
+                   cache_folder=prep_cache_folder, queue_size=64):
+    """
+    Prepare a SMILES/SDF library and yield the PDBQT ligands as soon as they are ready.
+    Preparation runs in the background, so docking can start with the first ligands
+    while the rest of the library is still being converted. Converted molecules are
+    cached by input hash, so unchanged molecules are never prepared twice.
+
+    Args:
+        input_path: Path to a molecule file or to a folder of molecule files
+        workers: Number of preparation processes
+        name_filter: Set of ligand names to prepare, or None for all
+        output_folder: Folder where the prepared PDBQT files are placed
+        cache_folder: Folder of the conversion cache
+        queue_size: Maximum number of prepared ligands waiting for docking
+
+    Yields:
+        Path to each prepared ligand PDBQT file
+    """
+    output_folder.mkdir(parents=True, exist_ok=True)
+    cache_folder.mkdir(parents=True, exist_ok=True)
+
+    ready = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+
+    producer = threading.Thread(
+        target=produce_ligands,
+        args=(Path(input_path), max(1, workers), name_filter, output_folder, cache_folder, ready, stop_event, errors),
+        daemon=True
+    )
+    producer.start()
+
+    try:
+        while True:
+            ligand = ready.get()
+            if ligand is None:
+                break
+            yield ligand
+    finally:
+        stop_event.set()        # also stops the producer if docking ends early
+
+    if errors:
+        raise errors[0]
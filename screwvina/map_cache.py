@@ -0,0 +1,160 @@
+"""
+map_cache.py - Grid Map Cache Module
+
+Contains the functions to precompute Vina affinity maps once per
+receptor/box/scoring combination and reuse them across runs.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from config import maps_cache_folder
+from file_utils import read_config_values
+
+
+# Config options that only affect the docking search, not the affinity maps;
+# every other option (box, spacing, scoring, weight_* ...) is part of the cache key
+DOCKING_ONLY_KEYS = ["cpu", "seed", "exhaustiveness", "num_modes", "energy_range", "min_rmsd",
+                     "max_evals", "verbosity", "out", "ligand", "receptor", "dir"]
+
+# Scoring functions for which Vina can compute the maps itself (ad4 maps come from autogrid)
+MAP_SCORINGS = ["vina", "vinardo"]
+
+MAP_PREFIX = "receptor"      # maps are written as <entry>/receptor.<type>.map
+
+
+def map_cache_key(receptor_path, config_path):
+    """
+    Compute the cache key of a receptor/box/scoring combination.
+    The key changes whenever the receptor content or any map-relevant
+    option of the configuration file changes.
+
+    Args:
+        receptor_path: Path to the receptor PDBQT file
+        config_path: Path to the configuration file
+
+    Returns:
+        Hexadecimal key, or None if the scoring function cannot be cached
+    """
+    values = read_config_values(config_path)
+
+    if values.get("scoring", "vina") not in MAP_SCORINGS:
+        return None
+
+    digest = hashlib.sha256()
+
+    with open(receptor_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+    values.setdefault("scoring", "vina")
+
+    for key in sorted(values):
+        if key in DOCKING_ONLY_KEYS:
+            continue
+        value = values[key]
+        try:
+            value = repr(float(value))      # 20 and 20.0 describe the same box
+        except ValueError:
+            pass
+        digest.update(f"\n{key}={value}".encode())
+
+    return digest.hexdigest()
+
+
+def evict_maps(cache_folder, max_bytes, keep=()):
+    """
+    Remove least recently used cache entries until the cache fits in max_bytes.
+
+    Args:
+        cache_folder: Path to the cache directory
+        max_bytes: Maximum cache size in bytes
+        keep: Keys that must not be removed (maps in use by the current run)
+
+    Returns:
+        Number of removed entries
+    """
+    if not cache_folder.exists():
+        return 0
+
+    entries = []
+    for entry in cache_folder.iterdir():
+        if not entry.is_dir() or entry.name.startswith("."):     # skip unfinished (temporary) entries
+            continue
+        size = sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+        entries.append((entry.stat().st_mtime, entry, size))
+
+    total = sum(size for _, _, size in entries)
+    removed = 0
+
+    for _, entry, size in sorted(entries, key=lambda e: e[0]):      # oldest first
+        if total <= max_bytes:
+            break
+        if entry.name in keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+
+    return removed
+
+
+def prepare_maps(receptor_path, config_path, vina_exe, cache_folder=maps_cache_folder):
+    """
+    Return the cached maps of a receptor/box combination, computing them if needed.
+
+    Args:
+        receptor_path: Path to the receptor PDBQT file
+        config_path: Path to the configuration file
+        vina_exe: Vina executable name or path
+        cache_folder: Path to the cache directory
+
+    Returns:
+        (key, maps_prefix) to be passed to Vina's --maps option,
+        or (None, None) if the maps cannot be cached or computed
+    """
+    key = map_cache_key(receptor_path, config_path)
+    if key is None:
+        return None, None
+
+    entry = cache_folder / key
+
+    if entry.exists():
+        os.utime(entry, None)       # mark as recently used
+        return key, entry / MAP_PREFIX
+
+    cache_folder.mkdir(parents=True, exist_ok=True)
+
+    # Maps are written to a temporary folder and moved in place only when complete,
+    # so that an interrupted run never leaves a half-written entry behind
+    tmp_entry = tempfile.mkdtemp(prefix=f".{key}.", dir=cache_folder)
+    os.chmod(tmp_entry, 0o755)
+
+    cmd = [
+        vina_exe,
+        "--receptor", str(receptor_path),
+        "--config", str(config_path),
+        "--write_maps", os.path.join(tmp_entry, MAP_PREFIX),
+        "--force_even_voxels"
+    ]
+
+    start = time.time()
+    with open(os.path.join(tmp_entry, "write_maps.log"), "w") as f:
+        result = subprocess.run(cmd, stdout=f, stderr=f)
+
+    if result.returncode != 0 or not any(name.endswith(".map") for name in os.listdir(tmp_entry)):
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return None, None
+
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:                 # another run cached the same maps in the meantime
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    print(f"Computed maps for {receptor_path.stem} in {time.time() - start:.1f} seconds")
+
+    return key, entry / MAP_PREFIX
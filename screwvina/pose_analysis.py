@@ -0,0 +1,253 @@
+"""
+pose_analysis.py - Pose Analysis Module
+
+Contains the functions to compare all the poses of each docking output:
+pairwise RMSD matrix, clustering and convergence check.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from config import results_folder, project_folder
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+CHUNK_SIZE = 256            # output files per worker task
+MIN_TOP_CLUSTER = 0.3       # fraction of poses the best cluster needs for a converged docking
+
+
+def find_outputs():
+    """
+    List the docking outputs of all vs_* directories as a stream.
+
+    Yields:
+        (receptor_name, ligand_name, path to the _out.pdbqt file)
+    """
+    if not results_folder.exists():
+        return
+
+    for directory in sorted(results_folder.iterdir()):
+        if not directory.is_dir() or not directory.name.startswith("vs_"):
+            continue
+        rec_name = directory.name.replace("vs_", "", 1)
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith("_out.pdbqt"):
+                    yield rec_name, entry.name[:-len("_out.pdbqt")], entry.path
+
+
+def read_poses(out_pdbqt):
+    """
+    Read the affinity and heavy atom coordinates of every pose of a Vina output.
+
+    Args:
+        out_pdbqt: Path to the _out.pdbqt file
+
+    Returns:
+        (affinities, coords): list of affinities and array of shape (poses, atoms, 3),
+        or (None, None) if the file has no poses or poses with different atoms
+    """
+    affinities = []
+    models = []
+    coords = []
+
+    with open(out_pdbqt, "r") as f:
+        for line in f:
+            if line.startswith("MODEL"):
+                coords = []
+            elif line.startswith("REMARK VINA RESULT:"):
+                affinities.append(float(line.split()[3]))
+            elif line.startswith(("ATOM", "HETATM")):
+                if line[77:79].strip() in ("H", "HD"):          # RMSD is computed on heavy atoms
+                    continue
+                coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+            elif line.startswith("ENDMDL"):
+                models.append(coords)
+
+    if not models or len(affinities) != len(models) or len(set(map(len, models))) != 1:
+        return None, None
+
+    return affinities, np.asarray(models)
+
+
+def pairwise_rmsd(coords):
+    """
+    Compute the RMSD between every pair of poses (poses are in the same frame, no fitting).
+
+    Args:
+        coords: Array of shape (poses, atoms, 3)
+
+    Returns:
+        Symmetric array of shape (poses, poses)
+    """
+    diff = coords[:, None, :, :] - coords[None, :, :, :]
+    return np.sqrt(np.einsum("ijkl,ijkl->ij", diff, diff) / coords.shape[1])
+
+
+def cluster_poses(rmsd, cutoff):
+    """
+    Cluster poses (sorted by affinity) around the best-scoring unassigned pose.
+
+    Args:
+        rmsd: Pairwise RMSD matrix
+        cutoff: RMSD cutoff in Angstroms
+
+    Returns:
+        Array with the cluster index of each pose (cluster 0 contains pose 1)
+    """
+    labels = np.full(len(rmsd), -1)
+    cluster = 0
+
+    for leader in range(len(rmsd)):
+        if labels[leader] != -1:
+            continue
+        members = (labels == -1) & (rmsd[leader] <= cutoff)
+        labels[members] = cluster
+        cluster += 1
+
+    return labels
+
+
+def analyze_output(rec_name, lig_name, out_pdbqt, cutoff):
+    """
+    Analyze the poses of one docking output.
+
+    Returns:
+        Result dictionary, or None if the output cannot be read
+    """
+    try:
+        affinities, coords = read_poses(out_pdbqt)
+    except (OSError, ValueError, IndexError):
+        return None
+    if affinities is None:
+        return None
+
+    n_poses = len(affinities)
+    rmsd = pairwise_rmsd(coords)
+    labels = cluster_poses(rmsd, cutoff)
+    affinities = np.asarray(affinities)
+
+    populations = np.bincount(labels)
+    best = [affinities[labels == c].min() for c in range(len(populations))]
+    top = int(np.argmax(populations))       # most populated cluster (first one in case of ties)
+
+    upper = rmsd[np.triu_indices(n_poses, k=1)]
+
+    return {
+        "receptor": rec_name,
+        "ligand": lig_name,
+        "poses": n_poses,
+        "clusters": len(populations),
+        "top_size": int(populations[top]),
+        "top_best": float(best[top]),
+        "mean_rmsd": float(upper.mean()) if upper.size else 0.0,
+        "max_rmsd": float(upper.max()) if upper.size else 0.0,
+        "summary": ";".join(f"{p}:{b:.3f}" for p, b in zip(populations, best)),
+        # converged: the best pose belongs to the most populated cluster, which holds enough poses
+        "converged": top == 0 and populations[top] >= MIN_TOP_CLUSTER * n_poses
+    }
+
+
+def analyze_chunk(chunk, cutoff):
+    """Analyze a chunk of outputs in a worker process (unreadable outputs are counted)."""
+    results = []
+    skipped = 0
+    for rec_name, lig_name, out_pdbqt in chunk:
+        result = analyze_output(rec_name, lig_name, out_pdbqt, cutoff)
+        if result is None:
+            skipped += 1
+        else:
+            results.append(result)
+    return results, skipped
+
+
+def chunks(items, size):
+    """Group an iterable into lists of at most size items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyze_poses(output_filename="pose_analysis.tsv", rmsd_cutoff=2.0, workers=None):
+
+    print("=" * 70)
+    print("STARTING POSE ANALYSIS...")
+    print("=" * 70)
+
+    if not HAS_NUMPY:
+        print("ERROR: Pose analysis requires NumPy (conda install -c conda-forge numpy)")
+        return
+
+    if not results_folder.exists():
+        print(f"ERROR: Output folder {results_folder} does not exist")
+        return
+
+    workers = workers or os.cpu_count() or 1
+    out_file = project_folder / output_filename
+
+    analyzed = 0
+    skipped = 0
+    poor = 0
+
+    # Outputs are listed, analyzed and written as a stream: at most 2 x workers chunks are
+    # in memory at any time, whatever the number of outputs
+
+    with open(out_file, "w") as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        f.write(
+            "Receptor\tLigand\tPoses\tClusters\tTop_Cluster_Size\tTop_Cluster_Best_Affinity\t"
+            "Avg_Pairwise_RMSD\tMax_Pairwise_RMSD\tCluster_Sizes_Best_Affinities\tConverged\n"
+        )
+
+        pending = set()
+        chunk_iter = chunks(find_outputs(), CHUNK_SIZE)
+        exhausted = False
+
+        while pending or not exhausted:
+            while not exhausted and len(pending) < 2 * workers:
+                chunk = next(chunk_iter, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(analyze_chunk, chunk, rmsd_cutoff))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, chunk_skipped = future.result()
+                skipped += chunk_skipped
+
+                for r in results:
+                    f.write(
+                        f"{r['receptor']}\t"
+                        f"{r['ligand']}\t"
+                        f"{r['poses']}\t"
+                        f"{r['clusters']}\t"
+                        f"{r['top_size']}\t"
+                        f"{r['top_best']:.3f}\t"
+                        f"{r['mean_rmsd']:.3f}\t"
+                        f"{r['max_rmsd']:.3f}\t"
+                        f"{r['summary']}\t"
+                        f"{'yes' if r['converged'] else 'no'}\n"
+                    )
+                    if not r["converged"]:
+                        poor += 1
+
+                analyzed += len(results)
+
+    print(f"Pose analysis completed: {analyzed} outputs ({skipped} unreadable or empty)")
+    print(f"Poorly converged pairs: {poor}")
+    print(f"Results saved to {out_file}")
+    print("=" * 70)
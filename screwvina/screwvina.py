@@ -9,6 +9,8 @@ import sys
 
 from docking import vina_docking
 from analysis import analyze_results
+from watch import vina_watch
+from pose_analysis import analyze_poses
 
 
 
@@ -77,6 +79,52 @@ def main():
         help = "Path to a global/master configuration file to use when receptor-specific config is not found"
     )
 
+    dock_parser.add_argument(
+        "--map-cache",
+        action = "store_true",
+        help = "Precompute affinity maps once per receptor/box/scoring and reuse them across runs"
+    )
+
+    dock_parser.add_argument(
+        "--map-cache-size",
+        type = int,
+        default = 2048,
+        help = "Maximum size of the map cache in MB, least recently used maps are evicted (default: 2048)"
+    )
+
+    dock_parser.add_argument(
+        "--prepare",
+        type = str,
+        default = None,
+        help = "SMILES/SDF file (or folder) to convert to PDBQT with RDKit/Meeko while docking runs"
+    )
+
+    dock_parser.add_argument(
+        "--prep-workers",
+        type = int,
+        default = None,
+        help = "Number of ligand preparation processes (default: a quarter of the system cores)"
+    )
+
+    dock_parser.add_argument(
+        "--pairs",
+        type = str,
+        default = None,
+        help = "TSV/CSV manifest (optionally gzipped) of receptor/ligand pairs to dock, with an optional config column"
+    )
+
+    dock_parser.add_argument(
+        "--adaptive",
+        action = "store_true",
+        help = "Raise or lower the number of parallel jobs (up to --jobs) following system load and memory"
+    )
+
+    dock_parser.add_argument(
+        "--dedup",
+        action = "store_true",
+        help = "Dock only one ligand per group of identical molecules and copy its results to the others"
+    )
+
 
     # ANALYZE command:
     analyze_parser = subparsers.add_parser("analyze", help="Analyze docking results only")
@@ -87,6 +135,76 @@ def main():
         help = "Output filename (default: vina_results.tsv)"
     )
 
+    analyze_parser.add_argument(
+        "--poses",
+        action = "store_true",
+        help = "Also compare all poses of each output: pairwise RMSD, clustering and convergence (requires NumPy)"
+    )
+
+    analyze_parser.add_argument(
+        "--poses-out",
+        default = "pose_analysis.tsv",
+        help = "Output filename of the pose analysis (default: pose_analysis.tsv)"
+    )
+
+    analyze_parser.add_argument(
+        "--rmsd-cutoff",
+        type = float,
+        default = 2.0,
+        help = "RMSD cutoff in Angstroms for pose clustering (default: 2.0)"
+    )
+
+    analyze_parser.add_argument(
+        "--workers",
+        type = int,
+        default = None,
+        help = "Number of processes for the pose analysis (default: all system cores)"
+    )
+
+
+    # WATCH command:
+    watch_parser = subparsers.add_parser("watch", help="Keep docking new or changed ligands and receptors as they appear")
+
+    watch_parser.add_argument(
+        "--vina",
+        default = "vina",
+        help = "Name or path of the vina executable (default: vina)"
+    )
+    watch_parser.add_argument(
+        "--jobs",
+        type = int,
+        default = None,
+        help = "Number of parallel docking jobs (default: auto-calculated based on system cores)"
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type = float,
+        default = 10,
+        help = "Seconds between two checks of the receptor and ligand folders (default: 10)"
+    )
+    watch_parser.add_argument(
+        "--global-config",
+        type = str,
+        default = None,
+        help = "Path to a global/master configuration file to use when receptor-specific config is not found"
+    )
+    watch_parser.add_argument(
+        "--map-cache",
+        action = "store_true",
+        help = "Precompute affinity maps once per receptor/box/scoring and reuse them across runs"
+    )
+    watch_parser.add_argument(
+        "--map-cache-size",
+        type = int,
+        default = 2048,
+        help = "Maximum size of the map cache in MB, least recently used maps are evicted (default: 2048)"
+    )
+    watch_parser.add_argument(
+        "--out",
+        default = "vina_results.tsv",
+        help = "Output filename, updated as dockings complete (default: vina_results.tsv)"
+    )
+
 
     # Read arguments
     args = parser.parse_args()
@@ -103,15 +221,41 @@ def main():
                 ligand_filter=args.ligands,
                 receptor_list_file=args.receptors_list,
                 ligand_list_file=args.ligands_list,
-                global_config=args.global_config
+                global_config=args.global_config,
+                map_cache=args.map_cache,
+                map_cache_size=args.map_cache_size,
+                prepare_input=args.prepare,
+                prep_workers=args.prep_workers,
+                pairs_file=args.pairs,
+                adaptive=args.adaptive,
+                dedup=args.dedup
             )
     
             if not args.no_analyze:     # does everything, unless analysis is disabled with --no-analyze
                 print()
                 analyze_results()
             
+        elif args.command == "watch":
+            vina_watch(
+                vina_exe=args.vina,
+                num_jobs=args.jobs,
+                global_config=args.global_config,
+                interval=args.interval,
+                map_cache=args.map_cache,
+                map_cache_size=args.map_cache_size,
+                output_filename=args.out
+            )
+
         elif args.command == "analyze":
             analyze_results(output_filename=args.out)   # just perform final analysis
+
+            if args.poses:
+                print()
+                analyze_poses(
+                    output_filename=args.poses_out,
+                    rmsd_cutoff=args.rmsd_cutoff,
+                    workers=args.workers
+                )
     
     except Exception as e:
         print(f"ERROR: {e}")
@@ -8,13 +8,19 @@ Contains the function to execute a single Vina docking.
 import subprocess
 
 
-def vina_execution(receptor_path, ligand_path, config_path, output_pdbqt, output_log, vina_exe):
+def vina_execution(receptor_path, ligand_path, config_path, output_pdbqt, output_log, vina_exe, maps_prefix=None,
+                   new_session=False):
 
-    # Command definition:
+    # Command definition (precomputed maps replace the receptor when available):
+
+    if maps_prefix is not None:
+        target = ["--maps", str(maps_prefix)]
+    else:
+        target = ["--receptor", str(receptor_path)]
 
     cmd = [
         vina_exe,
-        "--receptor", str(receptor_path),
+        *target,
         "--ligand", str(ligand_path),
         "--config", str(config_path),
         "--out", str(output_pdbqt)
@@ -23,9 +29,9 @@ def vina_execution(receptor_path, ligand_path, config_path, output_pdbqt, output
     output_pdbqt.parent.mkdir(parents=True, exist_ok=True)
     output_log.parent.mkdir(parents=True, exist_ok=True)
 
-    # Vina execution and log saving:
+    # Vina execution and log saving (in its own session, Vina does not receive the Ctrl+C of the terminal):
 
     with open(output_log, "w") as f:
-        result = subprocess.run(cmd, stdout=f, stderr=f)
+        result = subprocess.run(cmd, stdout=f, stderr=f, start_new_session=new_session)
 
     return result.returncode
@@ -0,0 +1,478 @@
+"""
+watch.py - Watch Module
+
+Contains the long-running workflow that docks new or changed ligands and
+receptors as they land in their folders and keeps the analysis up to date.
+"""
+
+import glob
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+
+from config import receptors_folder, ligands_folder, results_folder, project_folder, maps_cache_folder
+from cpu_utils import get_system_cores, read_cpu_from_config, calculate_optimal_jobs
+from docking import plan_receptors, make_task, run_task, cached_maps
+from map_cache import evict_maps
+from analysis import collect_results, summarize_log, write_results, append_results, read_results
+
+
+SETTLE_TIME = 2         # seconds a file must be left untouched before it is docked
+FULL_SCAN_EVERY = 30    # full rescan every N polls, to catch files rewritten in place
+COMPACT_RATIO = 2       # the journal is compacted at startup once it has twice as many lines as docked pairs
+REWRITE_BACKOFF = 20    # the results file is rewritten at most once every 20 x the time a rewrite takes
+
+state_file = results_folder / ".watch_state.json"
+done_file = results_folder / ".watch_done.tsv"
+
+
+def scan_folder(folder, previous=None):
+    """
+    Take a snapshot of the PDBQT files of a folder.
+
+    Args:
+        folder: Path to the folder
+        previous: Previous snapshot; files still being written (modified less than
+            SETTLE_TIME seconds ago) keep their previous signature, or are left out if new
+
+    Returns:
+        (snapshot, settled): dictionary of name (without extension) -> [mtime_ns, size],
+        and False if some files were still being written (the folder must be scanned again)
+    """
+    snapshot = {}
+    settled = True
+    now = time.time_ns()
+
+    if not folder.exists():
+        return snapshot, settled
+
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.name.endswith(".pdbqt"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            name = entry.name[:-len(".pdbqt")]
+            if now - stat.st_mtime_ns < SETTLE_TIME * 1_000_000_000:
+                settled = False
+                if previous is not None and name in previous:
+                    snapshot[name] = previous[name]
+                continue
+            snapshot[name] = [stat.st_mtime_ns, stat.st_size]
+
+    return snapshot, settled
+
+
+def changed_files(old, new):
+    """Return the names that are new or whose signature changed between two snapshots."""
+    return [name for name, signature in new.items() if old.get(name) != signature]
+
+
+def load_state():
+    """Load the snapshots saved by the previous watch session (empty if none)."""
+    try:
+        with open(state_file, "r") as f:
+            state = json.load(f)
+        return state.get("receptors", {}), state.get("ligands", {})
+    except (FileNotFoundError, ValueError):
+        return {}, {}
+
+
+def save_state(receptors, ligands):
+    """Save the snapshots of the files whose dockings have been planned."""
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = state_file.with_name(f"{state_file.name}.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump({"receptors": receptors, "ligands": ligands}, f)
+    os.replace(tmp_file, state_file)
+
+
+def load_done():
+    """
+    Replay the journal of the pairs docked by the previous sessions.
+    Each line is "+" (docked with valid outputs) or "-" (outputs removed), receptor and ligand.
+
+    Returns:
+        (done, lines): dictionary receptor name -> set of the ligand names docked with
+        valid outputs, and number of lines of the journal
+    """
+    done = {}
+    lines = 0
+    try:
+        with open(done_file, "r") as f:
+            for line in f:
+                lines += 1
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3:
+                    continue            # last line cut by a crash
+                if parts[0] == "+":
+                    done.setdefault(parts[1], set()).add(parts[2])
+                elif parts[0] == "-":
+                    done.get(parts[1], set()).discard(parts[2])
+    except FileNotFoundError:
+        pass
+    return done, lines
+
+
+def compact_done(done, receptors, ligands):
+    """Rewrite the journal with one line per docked pair of the given receptors and ligands."""
+    tmp_file = done_file.with_name(f"{done_file.name}.tmp")
+    with open(tmp_file, "w") as f:
+        for rec_name, lig_names in done.items():
+            if rec_name in receptors:
+                for lig_name in lig_names:
+                    if lig_name in ligands:
+                        f.write(f"+\t{rec_name}\t{lig_name}\n")
+    os.replace(tmp_file, done_file)
+
+
+def invalidate_outputs(plan, lig_name):
+    """Remove the outputs of a pair, so that it is docked again (also after a restart)."""
+    paths = [plan["rec_folder"] / f"{lig_name}_out.pdbqt",
+             plan["log_folder"] / f"{plan['name']}_{lig_name}.log"]
+    # outputs of the same pair docked with a configuration override (<ligand>@<config>)
+    paths += plan["rec_folder"].glob(f"{glob.escape(lig_name)}@*_out.pdbqt")
+    paths += plan["log_folder"].glob(f"{glob.escape(plan['name'])}_{glob.escape(lig_name)}@*.log")
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def vina_watch(vina_exe="vina", num_jobs=None, global_config=None, interval=10,
+               map_cache=False, map_cache_size=2048, output_filename="vina_results.tsv"):
+
+    print("=" * 70)
+    print("STARTING WATCH MODE...")
+    print("=" * 70)
+
+
+    # Step 1: Restore the state of the previous session and take the current snapshots
+
+    results_folder.mkdir(parents=True, exist_ok=True)
+
+    saved_receptors, saved_ligands = load_state()
+    receptor_files, receptors_settled = scan_folder(receptors_folder)
+    ligand_files, ligands_settled = scan_folder(ligands_folder)
+
+    # Docked pairs are appended to a journal as they complete; it is only rewritten
+    # here, when it has grown well beyond the number of pairs it describes
+    saved_done, journal_lines = load_done()
+    if journal_lines > COMPACT_RATIO * sum(len(lig_names) for lig_names in saved_done.values()):
+        compact_done(saved_done, saved_receptors, saved_ligands)
+    journal = open(done_file, "a")
+
+    plans = {}              # receptor name -> receptor dictionary from plan_receptors()
+    backlog = deque()       # tasks waiting for a free worker
+    queued = set()          # (receptor, ligand) pairs waiting or running
+    stale = set()           # pairs whose files changed while they were running
+
+    # Results of the previous dockings are read back from the results file (the logs are
+    # only parsed when there is none), then updated incrementally
+    out_file = project_folder / output_filename
+    previous_results = read_results(out_file)
+    rewrite = previous_results is None      # rows removed or replaced: the results file must be rewritten
+    if previous_results is None and any(results_folder.glob("vs_*")):
+        previous_results = collect_results()
+
+    results = {(r["receptor"], r["ligand"]): r for r in (previous_results or [])}
+    overrides = {}          # (receptor, ligand) -> result keys of its <ligand>@<config> dockings (--pairs runs)
+    for rec_name, lig_name in results:
+        if "@" in lig_name:
+            overrides.setdefault((rec_name, lig_name.partition("@")[0]), []).append((rec_name, lig_name))
+    del previous_results
+
+    new_rows = []           # results not yet appended to the results file
+    last_write = time.time()
+    write_cost = 0.0        # seconds taken by the last rewrite of the results file
+    success = 0
+    failed = 0
+
+    maps_in_use = set()
+    maps_for = partial(cached_maps, vina_exe=vina_exe, memo={}, maps_in_use=maps_in_use) if map_cache else None
+
+
+    def update_plans(names):
+        # (re)read the configuration of new or changed receptors
+        for name in names:
+            plans.pop(name, None)
+        for plan in plan_receptors([receptors_folder / f"{name}.pdbqt" for name in names], global_config):
+            if maps_for is not None:
+                plan["maps"] = maps_for(plan["receptor"], plan["config"])
+            plans[plan["name"]] = plan
+
+    def record(rec_name, lig_name, docked):
+        journal.write(f"{'+' if docked else '-'}\t{rec_name}\t{lig_name}\n")
+
+    def drop_results(key):
+        # remove the results of a pair (and of its configuration overrides)
+        nonlocal rewrite
+        if results.pop(key, None) is not None:
+            rewrite = True
+        for override in overrides.pop(key, ()):
+            results.pop(override, None)
+            rewrite = True
+
+    def add_result(key, stats):
+        nonlocal rewrite
+        if key in results:
+            rewrite = True          # the old row is in the results file
+        else:
+            new_rows.append(key)
+        results[key] = {"receptor": key[0], "ligand": key[1], **stats}
+
+    def enqueue(plan, lig_name, force=False):
+        key = (plan["name"], lig_name)
+        if key in queued:
+            if force:
+                stale.add(key)      # docked again once the running docking is done
+            return
+        if force:
+            invalidate_outputs(plan, lig_name)
+            record(*key, False)
+            drop_results(key)
+        task = make_task(plan, ligands_folder / f"{lig_name}.pdbqt")
+        if task is not None:
+            backlog.append(task)
+            queued.add(key)
+            return
+        record(*key, True)
+        if key not in results:      # docked by another run: only this log is read
+            stats = summarize_log(plan["log_folder"] / f"{plan['name']}_{lig_name}.log")
+            if stats is not None:
+                add_result(key, stats)
+
+    def enqueue_changes(new_receptors, new_ligands, old_receptors, old_ligands):
+        # new or changed receptors are docked against every ligand, new or changed ligands
+        # against every other receptor; files that existed before were rewritten, so their
+        # old outputs are no longer valid
+        update_plans(new_receptors)
+        new_ligands = set(new_ligands)
+        for rec_name in new_receptors:
+            if rec_name in plans:
+                for lig_name in ligand_files:
+                    force = rec_name in old_receptors or (lig_name in new_ligands and lig_name in old_ligands)
+                    enqueue(plans[rec_name], lig_name, force)
+        new_receptors = set(new_receptors)
+        for lig_name in new_ligands:
+            for rec_name, plan in plans.items():
+                if rec_name not in new_receptors:
+                    enqueue(plan, lig_name, force=lig_name in old_ligands)
+
+    def finish(task, code):
+        # count a finished docking and update its results
+        nonlocal success, failed
+        rec_name = task["receptor"].stem
+        lig_name = task["ligand"].stem
+        queued.discard((rec_name, lig_name))
+
+        if code == 0:
+            success += 1
+            stats = summarize_log(task["output_log"])
+            if stats is not None:
+                add_result((rec_name, lig_name), stats)
+                record(rec_name, lig_name, True)
+        else:
+            failed += 1
+
+        if (rec_name, lig_name) in stale and rec_name in plans:
+            stale.discard((rec_name, lig_name))
+            if stopping:
+                invalidate_outputs(plans[rec_name], lig_name)      # docked again at restart
+                record(rec_name, lig_name, False)
+                drop_results((rec_name, lig_name))
+            else:
+                enqueue(plans[rec_name], lig_name, force=True)
+
+    def collect(future, task):
+        # a docking that raised (Vina missing, too many open files...) is counted as failed,
+        # the daemon keeps running
+        try:
+            code = future.result()
+        except Exception as e:
+            print(f"WARNING: Docking of {task['ligand'].stem} on {task['receptor'].stem} failed: {e}")
+            code = None
+        finish(task, code)
+
+    def flush_results():
+        # append the new rows, or rewrite the whole file when rows were removed or replaced
+        nonlocal new_rows, rewrite, last_write, write_cost
+        if rewrite:
+            start = time.time()
+            write_results(results.values(), out_file)
+            write_cost = time.time() - start
+            rewrite = False
+        elif new_rows:
+            append_results((results[key] for key in new_rows if key in results), out_file)
+        new_rows = []
+        journal.flush()
+        last_write = time.time()
+
+
+    # Step 2: Initial plan: files changed since the last session are docked again, pairs of
+    #         unchanged files docked by the last session are skipped without touching their
+    #         outputs, everything else is docked only if its outputs are missing or empty
+
+    update_plans(list(receptor_files))
+    changed_receptors = set(name for name in saved_receptors if name in receptor_files
+                            and saved_receptors[name] != receptor_files[name])
+    changed_ligands = set(name for name in saved_ligands if name in ligand_files
+                          and saved_ligands[name] != ligand_files[name])
+
+    for rec_name, plan in plans.items():
+        unchanged = rec_name in saved_receptors and rec_name not in changed_receptors
+        docked = saved_done.get(rec_name, set()) if unchanged else set()
+        for lig_name in ligand_files:
+            if lig_name in docked and lig_name in saved_ligands and lig_name not in changed_ligands:
+                continue
+            enqueue(plan, lig_name, force=rec_name in changed_receptors or lig_name in changed_ligands)
+    del saved_done
+
+    journal.flush()         # invalidated pairs must be in the journal before the new snapshots are saved
+    save_state(receptor_files, ligand_files)
+
+
+    # Step 3: Results file with the results of the previous dockings (updated incrementally from now on)
+
+    flush_results()
+
+
+    # Step 4: Worker pool size
+
+    if num_jobs is None:
+        system_cores = get_system_cores()
+        first_config = next(iter(plans.values()))["config"] if plans else None
+        config_cpu = read_cpu_from_config(first_config) if first_config is not None else 1
+        num_jobs = calculate_optimal_jobs(config_cpu, system_cores)
+
+    print(f"Receptors: {len(plans)}")
+    print(f"Ligands: {len(ligand_files)}")
+    print(f"Dockings to perform: {len(backlog)}")
+    print(f"Parallel jobs: {num_jobs}")
+    print(f"Watching {receptors_folder} and {ligands_folder} every {interval} seconds (Ctrl+C to stop)")
+    print("=" * 70)
+
+
+    # Step 5: Clean shutdown on Ctrl+C / SIGTERM: queued dockings are dropped
+    #         (their outputs are missing, so they are planned again at restart), running ones are completed
+    #         (Vina runs in its own session, so the Ctrl+C of the terminal does not reach it)
+
+    stopping = []
+
+    def request_stop(signum, frame):
+        if not stopping:
+            print("\nStopping: waiting for the running dockings to finish...")
+        stopping.append(signum)
+
+    previous_handlers = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+
+
+    # Step 6: Main loop: poll the folders, keep the workers busy, update the results
+
+    polls = 0
+    last_scan = time.time()
+    last_write = time.time()
+    receptors_mtime = receptors_folder.stat().st_mtime_ns if receptors_folder.exists() else 0
+    ligands_mtime = ligands_folder.stat().st_mtime_ns if ligands_folder.exists() else 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:      # persistent workers
+            running = {}
+
+            while not stopping:
+
+                # Step 6.1: poll the folders (file contents are only listed again when a folder
+                # changed, when files were still being written at the previous poll, or every
+                # FULL_SCAN_EVERY polls for files rewritten in place)
+                if time.time() - last_scan >= interval:
+                    last_scan = time.time()
+                    polls += 1
+                    full_scan = polls % FULL_SCAN_EVERY == 0
+
+                    old_receptors, old_ligands = receptor_files, ligand_files
+                    new_receptors = []
+                    new_ligands = []
+
+                    mtime = receptors_folder.stat().st_mtime_ns if receptors_folder.exists() else 0
+                    if full_scan or mtime != receptors_mtime or not receptors_settled:
+                        receptors_mtime = mtime
+                        snapshot, receptors_settled = scan_folder(receptors_folder, receptor_files)
+                        new_receptors = changed_files(receptor_files, snapshot)
+                        for name in set(receptor_files) - set(snapshot):
+                            plans.pop(name, None)
+                        receptor_files = snapshot
+
+                    mtime = ligands_folder.stat().st_mtime_ns if ligands_folder.exists() else 0
+                    if full_scan or mtime != ligands_mtime or not ligands_settled:
+                        ligands_mtime = mtime
+                        snapshot, ligands_settled = scan_folder(ligands_folder, ligand_files)
+                        new_ligands = changed_files(ligand_files, snapshot)
+                        ligand_files = snapshot
+
+                    if new_receptors or new_ligands:
+                        before = len(backlog)
+                        enqueue_changes(new_receptors, new_ligands, old_receptors, old_ligands)
+                        print(f"[{time.strftime('%H:%M:%S')}] {len(new_receptors)} receptors and "
+                              f"{len(new_ligands)} ligands new or changed: {len(backlog) - before} dockings queued")
+                        journal.flush()
+                        save_state(receptor_files, ligand_files)
+
+                # Step 6.2: keep the workers busy
+                while backlog and len(running) < 2 * num_jobs:
+                    task = backlog.popleft()
+                    running[executor.submit(run_task, task, vina_exe, new_session=True)] = task
+
+                if not running:
+                    time.sleep(min(1.0, interval))
+                    continue
+
+                finished, _ = wait(running, timeout=1.0, return_when=FIRST_COMPLETED)
+
+                # Step 6.3: collect the finished dockings
+                for future in finished:
+                    collect(future, running.pop(future))
+
+                    if (success + failed) % 25 == 0:
+                        print(f"Progress: {success + failed} done (ok={success}, errors={failed}), "
+                              f"{len(backlog) + len(running)} pending")
+
+                # Step 6.4: update the results file (new rows are appended; a full rewrite, needed
+                # when rows were removed, waits longer as the table grows so that the workers are
+                # not left waiting for new tasks)
+                delay = max(interval, REWRITE_BACKOFF * write_cost) if rewrite else interval
+                if (new_rows or rewrite) and (time.time() - last_write >= delay or not (backlog or running)):
+                    flush_results()
+
+            # Stop requested: drop the queued dockings, complete the running ones
+            for future in running:
+                future.cancel()
+            for future, task in running.items():
+                if not future.cancelled():
+                    collect(future, task)
+
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+        flush_results()
+        journal.close()
+        if map_cache:
+            evict_maps(maps_cache_folder, map_cache_size * 1024 * 1024, keep=maps_in_use)
+
+
+    # Step 7: Show final results
+
+    print("=" * 70)
+    print("WATCH MODE STOPPED")
+    print("=" * 70)
+    print(f"Successful: {success}")
+    print(f"Failed: {failed}")
+    print(f"Results saved to {out_file}")
+    print("=" * 70)
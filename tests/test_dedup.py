@@ -0,0 +1,55 @@
+"""
+Checks of the ligand fingerprint used by --dedup: copies of a ligand with a
+different atom order and position share its fingerprint, stereoisomers do not.
+"""
+
+import random
+import sys
+from pathlib import Path
+
+project_folder = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_folder / "screwvina"))
+
+from dedup import ligand_fingerprint
+
+
+ligand = project_folder / "ligands" / "DB18079.pdbqt"
+
+
+def transform(path, out_path, function, shuffle=False):
+    """Write a copy of a ligand with function applied to every (x, y, z), atom lines optionally shuffled."""
+    lines = path.read_text().splitlines(keepends=True)
+    atoms = [i for i, line in enumerate(lines) if line.startswith(("ATOM", "HETATM"))]
+
+    for i in atoms:
+        line = lines[i]
+        x, y, z = function(float(line[30:38]), float(line[38:46]), float(line[46:54]))
+        lines[i] = f"{line[:30]}{x:8.3f}{y:8.3f}{z:8.3f}{line[54:]}"
+
+    if shuffle:     # serial numbers are kept, so the torsion tree still refers to the same atoms
+        order = atoms[:]
+        random.Random(0).shuffle(order)
+        moved = [lines[i] for i in order]
+        for i, line in zip(atoms, moved):
+            lines[i] = line
+
+    out_path.write_text("".join(lines))
+    return out_path
+
+
+def test_permuted_translated_copy_matches(tmp_path):
+    # atom order shuffled, rotated by 90 degrees around z and translated
+    copy = transform(ligand, tmp_path / "copy.pdbqt", lambda x, y, z: (-y + 3.1, x - 2.7, z + 5.0), shuffle=True)
+    assert ligand_fingerprint(copy) == ligand_fingerprint(ligand)
+
+
+def test_enantiomer_differs(tmp_path):
+    mirror = transform(ligand, tmp_path / "mirror.pdbqt", lambda x, y, z: (-x, y, z))
+    assert ligand_fingerprint(mirror) != ligand_fingerprint(ligand)
+
+
+def test_mirrored_enantiomer_copies_match(tmp_path):
+    # two differently placed copies of the enantiomer are still the same molecule
+    first = transform(ligand, tmp_path / "first.pdbqt", lambda x, y, z: (-x, y, z))
+    second = transform(ligand, tmp_path / "second.pdbqt", lambda x, y, z: (x + 1.5, -y, z - 4.0), shuffle=True)
+    assert ligand_fingerprint(first) == ligand_fingerprint(second)